@@ -4,6 +4,11 @@ import random
 import os
 import math
 import json
+import time
+import queue
+import atexit
+import asyncio
+import threading
 from datetime import datetime
 
 # Initialize Pygame
@@ -31,6 +36,15 @@ WEATHER_CHANGE_INTERVAL = 10000  # Weather changes every 10 seconds
 
 # Add after the game constants
 LEADERBOARD_FILE = 'leaderboard.json'
+LEADERBOARD_LOG = 'leaderboard.log'  # Scores added since the last snapshot, one JSON line each
+LOG_SYNC_INTERVAL = 0.5  # Seconds of new scores gathered into one fsync
+LOG_COMPACT_ENTRIES = 20  # Log lines that trigger folding the log into the snapshot
+BROWSER_LEADERBOARD_KEY = 'flappybird_leaderboard'  # The whole board in one item, as saved by older builds
+BROWSER_INDEX_KEY = 'flappybird_score_ids'  # Ids of the stored entries, in board order
+BROWSER_ENTRY_PREFIX = 'flappybird_score:'  # One item per entry, keyed by its id
+SAVE_DEBOUNCE = 500  # Milliseconds without a new score before browser storage is written
+SAVE_MAX_DELAY = 5000  # Write anyway after this long, even mid-game
+SAVE_ITEMS_PER_FRAME = 2  # localStorage calls per frame while writing
 MAX_LEADERBOARD_ENTRIES = 10
 NAME_INPUT_BOX = pygame.Rect(SCREEN_WIDTH//2 - 150, SCREEN_HEIGHT//2, 300, 40)
 
@@ -514,8 +528,11 @@ class Bird:
         self.particles = []
         self.trail_particles = []  # Add trail particles for more realistic movement
 
-    def update(self):
-        if game_state == GAME_STATE_PLAYING:
+    def update(self, playing=None):
+        # The desktop loop keeps its state in this module; other callers say whether a game is on
+        if playing is None:
+            playing = game_state == GAME_STATE_PLAYING
+        if playing:
             self.velocity += self.gravity
             self.y += self.velocity
             
@@ -576,12 +593,14 @@ class Bird:
         if jump_sound:
             jump_sound.play()
 
-    def draw(self):
+    def draw(self, surface=None):
+        if surface is None:
+            surface = screen
         # Draw trail particles
         for particle in self.trail_particles:
             alpha = int(255 * (particle['life'] / 40))
             color = (*particle['color'][:3], alpha)
-            pygame.draw.circle(screen, color,
+            pygame.draw.circle(surface, color,
                              (int(particle['x']), int(particle['y'])),
                              int(particle['size']))
 
@@ -589,7 +608,7 @@ class Bird:
         for particle in self.particles:
             alpha = int(255 * (particle['life'] / 20))
             color = (*particle['color'][:3], alpha)
-            pygame.draw.circle(screen, color,
+            pygame.draw.circle(surface, color,
                              (int(particle['x']), int(particle['y'])),
                              2)
 
@@ -602,13 +621,13 @@ class Bird:
         for i in range(3):
             alpha = shadow_alpha - i * 20
             if alpha > 0:
-                pygame.draw.circle(screen, (*SHADOW_COLOR[:3], alpha),
+                pygame.draw.circle(surface, (*SHADOW_COLOR[:3], alpha),
                                  (int(self.x + self.width/2 + shadow_offset + i),
                                   int(self.y + self.height/2 + shadow_offset + i)),
                                  self.width//2)
         
         # Draw Pac-Man body with highlight
-        pygame.draw.circle(screen, YELLOW,
+        pygame.draw.circle(surface, YELLOW,
                          (int(self.x + self.width/2), int(self.y + self.height/2)),
                          self.width//2)
         
@@ -617,7 +636,7 @@ class Bird:
         for i in range(3):
             alpha = 32 - i * 10
             if alpha > 0:
-                pygame.draw.circle(screen, (*HIGHLIGHT_COLOR[:3], alpha),
+                pygame.draw.circle(surface, (*HIGHLIGHT_COLOR[:3], alpha),
                                  (int(self.x + self.width/2 + highlight_offset - i),
                                   int(self.y + self.height/2 + highlight_offset - i)),
                                  self.width//4)
@@ -635,7 +654,7 @@ class Bird:
             for i in range(3):
                 alpha = 128 - i * 40
                 if alpha > 0:
-                    pygame.draw.circle(screen, (*shield_color, alpha),
+                    pygame.draw.circle(surface, (*shield_color, alpha),
                                      (int(self.x + self.width/2), int(self.y + self.height/2)),
                                      shield_radius - i, 2)
         
@@ -655,7 +674,7 @@ class Bird:
             points.append((int(x), int(y)))
         
         # Draw mouth (black triangle)
-        pygame.draw.polygon(screen, BLACK, points)
+        pygame.draw.polygon(surface, BLACK, points)
 
     def reset(self):
         self.x = 100
@@ -768,7 +787,9 @@ class Pipe:
                 if particle['life'] <= 0:
                     self.particles.remove(particle)
 
-    def draw(self):
+    def draw(self, surface=None):
+        if surface is None:
+            surface = screen
         # Create a surface for the pipe with per-pixel alpha
         pipe_surface = pygame.Surface((self.width, SCREEN_HEIGHT), pygame.SRCALPHA)
         
@@ -795,7 +816,7 @@ class Pipe:
             for particle in self.particles:
                 alpha = int(255 * (particle['life'] / 20))
                 color = (*particle['color'][:3], alpha)
-                pygame.draw.circle(screen, color,
+                pygame.draw.circle(surface, color,
                                  (int(particle['x']), int(particle['y'])),
                                  2)
         else:
@@ -804,8 +825,8 @@ class Pipe:
             self.draw_pipe_texture(pipe_surface, self.bottom_y, SCREEN_HEIGHT - self.bottom_y,
                                  PIPE_SHADOW, PIPE_COLOR)
         
-        # Blit the pipe surface onto the screen
-        screen.blit(pipe_surface, (self.x, 0))
+        # Blit the pipe surface onto the surface
+        surface.blit(pipe_surface, (self.x, 0))
 
     def draw_pipe_texture(self, surface, y, height, shadow_color, base_color):
         # Draw base pipe
@@ -1607,10 +1628,239 @@ class WinningCutscene:
             text_rect = text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2))
             screen.blit(text, text_rect)
 
+def merge_scores(board, entries):
+    # Crash recovery can replay a logged score that already made the snapshot, so duplicates are dropped
+    merged = {}
+    for entry in board + entries:
+        merged.setdefault((entry['name'], entry['score'], entry['date']), entry)
+    return sorted(merged.values(), key=lambda x: x['score'], reverse=True)[:MAX_LEADERBOARD_ENTRIES]
+
+def fsync_directory(path):
+    # Makes a rename durable; not possible on Windows, where the rename alone has to do
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+class ScoreLog:
+    # Desktop leaderboard storage. New scores are appended to a log by a background thread,
+    # and the log is periodically folded into a snapshot that is replaced atomically, so the
+    # frame loop never waits on disk and a crash at any point loses at most unsynced scores
+    def __init__(self, snapshot_path=LEADERBOARD_FILE, log_path=LEADERBOARD_LOG):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.pending = queue.Queue()
+        self.board = []  # Owned by the writer thread once it starts
+        self.log_entries = 0
+        self.thread = None
+
+    def load(self):
+        board = []
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'r') as f:
+                    board = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error reading leaderboard snapshot: {e}")
+        entries = []
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as f:
+                data = f.read()
+            valid = 0
+            for line in data.splitlines(keepends=True):
+                # Every complete write ends in a newline
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+                valid += len(line)
+            if valid < len(data):
+                # Drop a write cut short by a crash so new lines don't run on from it
+                os.truncate(self.log_path, valid)
+        self.log_entries = len(entries)
+        self.board = merge_scores(board, entries)
+        return list(self.board)
+
+    def append(self, entry):
+        self.start()
+        self.pending.put(dict(entry))
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._write_loop, daemon=True)
+            self.thread.start()
+            atexit.register(self.flush)
+
+    def flush(self, timeout=2.0):
+        # Wait for queued scores to reach the disk and fold the log into the snapshot
+        if self.thread is None:
+            return
+        done = threading.Event()
+        self.pending.put(done)
+        done.wait(timeout)
+
+    def _write_loop(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + LOG_SYNC_INTERVAL
+            while not isinstance(batch[-1], threading.Event):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            entries = [item for item in batch if isinstance(item, dict)]
+            flushes = [item for item in batch if isinstance(item, threading.Event)]
+            try:
+                if entries:
+                    self._append_log(entries)
+                if self.log_entries >= LOG_COMPACT_ENTRIES or (flushes and self.log_entries):
+                    self._compact()
+            except OSError as e:
+                print(f"Error saving leaderboard: {e}")
+            for done in flushes:
+                done.set()
+
+    def _append_log(self, entries):
+        with open(self.log_path, 'a') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.log_entries += len(entries)
+        self.board = merge_scores(self.board, entries)
+
+    def _compact(self):
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.board, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        fsync_directory(os.path.dirname(os.path.abspath(self.snapshot_path)))
+        # Everything logged is in the snapshot now; crashing before this only replays duplicates
+        open(self.log_path, 'w').close()
+        self.log_entries = 0
+
+class BrowserScoreStore:
+    # Pygbag leaderboard storage. Every entry is its own localStorage item next to a small index
+    # of ids, so a new score writes one entry and the index instead of the whole board. Writes are
+    # queued and made a couple per frame once scores stop arriving and no game is being played
+    def __init__(self, storage=None):
+        if storage is None:
+            import javascript
+            storage = javascript.window.localStorage
+        self.storage = storage
+        self.ids = {}  # (name, score, date) -> id of the stored item
+        self.next_id = 0
+        self.entry_writes = {}  # id -> JSON not yet written
+        self.removals = []  # Items to delete once the index no longer lists them
+        self.index_dirty = False
+        self.changed_at = None
+        self.loaded = False  # Nothing is saved until the stored board is read, so it can't be overwritten
+
+    async def load(self):
+        # Yields to the frame loop between items so a long board doesn't hold up the first frame
+        index_json = self.storage.getItem(BROWSER_INDEX_KEY)
+        if not index_json:
+            legacy_json = self.storage.getItem(BROWSER_LEADERBOARD_KEY)
+            board = json.loads(legacy_json) if legacy_json else []
+            self.loaded = True
+            if board:
+                # Moved into per-entry items by the next save
+                self.save(board)
+                self.removals.append(BROWSER_LEADERBOARD_KEY)
+            return board
+
+        board = []
+        for item_id in json.loads(index_json):
+            await asyncio.sleep(0)
+            if isinstance(item_id, int):
+                # Past corrupt items too, so a new entry never takes an id queued for removal
+                self.next_id = max(self.next_id, item_id + 1)
+            entry_json = self.storage.getItem(BROWSER_ENTRY_PREFIX + str(item_id))
+            try:
+                entry = json.loads(entry_json)
+                self.ids[(entry['name'], entry['score'], entry['date'])] = item_id
+            except (TypeError, ValueError, KeyError):
+                # Lost or corrupt item; rewrite the index without it
+                self.index_dirty = True
+                if entry_json:
+                    self.removals.append(BROWSER_ENTRY_PREFIX + str(item_id))
+                continue
+            board.append(entry)
+        self.loaded = True
+        if self.index_dirty:
+            self.changed_at = pygame.time.get_ticks()
+        return board
+
+    def save(self, board):
+        # Queue whatever changed since the last save; nothing is written until persist() runs
+        if not self.loaded:
+            return
+        keep = {}
+        for entry in board:
+            key = (entry['name'], entry['score'], entry['date'])
+            item_id = self.ids.get(key)
+            if item_id is None:
+                item_id = self.next_id
+                self.entry_writes[item_id] = json.dumps(entry)
+                self.next_id += 1
+            keep[key] = item_id
+        for key, item_id in self.ids.items():
+            if key not in keep:
+                if self.entry_writes.pop(item_id, None) is None:
+                    self.removals.append(BROWSER_ENTRY_PREFIX + str(item_id))
+        # Any new, dropped or reordered entry changes the index, which lists ids in board order
+        if list(keep.items()) != list(self.ids.items()):
+            self.index_dirty = True
+        self.ids = keep
+        self.changed_at = pygame.time.get_ticks()
+
+    def pending(self):
+        return bool(self.entry_writes or self.index_dirty or self.removals)
+
+    def persist(self, idle, now=None):
+        # Entries go first, then the index that lists them, then items it has dropped,
+        # so the index never names an item that isn't there
+        if not self.loaded or not self.pending():
+            return
+        now = pygame.time.get_ticks() if now is None else now
+        waited = now - self.changed_at
+        if waited < SAVE_DEBOUNCE or (not idle and waited < SAVE_MAX_DELAY):
+            return
+        for _ in range(SAVE_ITEMS_PER_FRAME):
+            if self.entry_writes:
+                item_id = next(iter(self.entry_writes))
+                self.storage.setItem(BROWSER_ENTRY_PREFIX + str(item_id), self.entry_writes.pop(item_id))
+            elif self.index_dirty:
+                self.storage.setItem(BROWSER_INDEX_KEY, json.dumps(list(self.ids.values())))
+                self.index_dirty = False
+            elif self.removals:
+                self.storage.removeItem(self.removals.pop())
+            else:
+                break
+
 class Leaderboard:
     def __init__(self):
         self.scores = []
-        self.load_scores()
+        # Check if running in browser (Pygbag)
+        self.is_browser = hasattr(sys, 'platform') and sys.platform.startswith('emscripten')
+        self.score_log = None if self.is_browser else ScoreLog()
+        self.score_store = BrowserScoreStore() if self.is_browser else None
+        if not self.is_browser:
+            self.load_scores()  # The browser board loads in load_scores_async()
         # Initialize previous_top_score and previous_top_name safely
         self.previous_top_score = self.get_top_score()
         self.previous_top_name = self.get_top_name()
@@ -1619,53 +1869,57 @@ class Leaderboard:
         self.beat_message_duration = 180  # 3 seconds at 60 FPS
         self.beat_message_scale = 1.0
         self.beat_message_growing = True
-        # Check if running in browser (Pygbag)
-        self.is_browser = hasattr(sys, 'platform') and sys.platform.startswith('emscripten')
 
     def load_scores(self):
         try:
-            if self.is_browser:
-                import asyncio
-                import javascript
-                scores_json = javascript.window.localStorage.getItem('flappybird_leaderboard')
-                if scores_json:
-                    self.scores = json.loads(scores_json)
-                else:
-                    self.scores = []
-                    self.save_scores()
-            else:
-                if os.path.exists(LEADERBOARD_FILE):
-                    with open(LEADERBOARD_FILE, 'r') as f:
-                        self.scores = json.load(f)
-                else:
-                    # Create empty leaderboard file if it doesn't exist
-                    self.scores = []
-                    self.save_scores()
+            self.scores = self.score_log.load()
         except Exception as e:
             print(f"Error loading leaderboard: {e}")
             self.scores = []
 
+    async def load_scores_async(self):
+        # Run as a task so the game starts drawing while the board is read
+        try:
+            loaded = await self.score_store.load()
+        except Exception as e:
+            print(f"Error loading leaderboard: {e}")
+            return
+        added = self.scores
+        self.scores = merge_scores(loaded, added)
+        if added:
+            self.save_scores()
+        self.previous_top_score = self.get_top_score()
+        self.previous_top_name = self.get_top_name()
+
     def save_scores(self):
         if self.is_browser:
-            import javascript
-            scores_json = json.dumps(self.scores)
-            javascript.window.localStorage.setItem('flappybird_leaderboard', scores_json)
-        else:
-            with open(LEADERBOARD_FILE, 'w') as f:
-                json.dump(self.scores, f)
+            self.score_store.save(self.scores)
+
+    def persist(self, idle):
+        # Called once per frame; idle is False while a game is being played
+        if self.is_browser:
+            try:
+                self.score_store.persist(idle)
+            except Exception as e:
+                print(f"Error saving leaderboard: {e}")
 
     def add_score(self, name, score):
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.scores.append({
+        entry = {
             'name': name,
             'score': score,
             'date': current_time
-        })
+        }
+        self.scores.append(entry)
         # Sort by score in descending order
         self.scores.sort(key=lambda x: x['score'], reverse=True)
         # Keep only top scores
         self.scores = self.scores[:MAX_LEADERBOARD_ENTRIES]
-        self.save_scores()
+        if self.is_browser:
+            self.save_scores()
+        else:
+            # Written and synced by the log's thread; the frame loop carries on
+            self.score_log.append(entry)
 
     def get_top_score(self):
         return self.scores[0]['score'] if self.scores else 0
@@ -1750,7 +2004,9 @@ class PowerUp:
             self.glow_phase = (self.glow_phase + self.glow_speed) % (2 * math.pi)
             self.x -= BASE_PIPE_SPEED  # Move with the same speed as pipes
 
-    def draw(self):
+    def draw(self, surface=None):
+        if surface is None:
+            surface = screen
         if not self.collected:
             # Draw power-up icon based on type
             if self.power_type == 'shield':
@@ -1763,17 +2019,17 @@ class PowerUp:
                 )
                 
                 # Draw outer glow
-                pygame.draw.circle(screen, glow_color, 
+                pygame.draw.circle(surface, glow_color, 
                                  (int(self.x + self.width/2), int(self.y + self.height/2)),
                                  self.width//2 + 5)
                 
                 # Draw shield
-                pygame.draw.circle(screen, SHIELD_COLOR,
+                pygame.draw.circle(surface, SHIELD_COLOR,
                                  (int(self.x + self.width/2), int(self.y + self.height/2)),
                                  self.width//2)
                 
                 # Draw shield symbol
-                pygame.draw.arc(screen, WHITE,
+                pygame.draw.arc(surface, WHITE,
                               (self.x + 5, self.y + 5, self.width - 10, self.height - 10),
                               0, math.pi, 3)
 
@@ -1796,7 +2052,9 @@ class Enemy:
         self.animation_frame += 1
         self.glow_phase = (self.glow_phase + self.glow_speed) % (2 * math.pi)
 
-    def draw(self):
+    def draw(self, surface=None):
+        if surface is None:
+            surface = screen
         # Draw enemy with glow effect
         glow_intensity = 0.5 + 0.5 * math.sin(self.glow_phase)
         glow_color = (
@@ -1806,26 +2064,26 @@ class Enemy:
         )
         
         # Draw outer glow
-        pygame.draw.circle(screen, glow_color, 
+        pygame.draw.circle(surface, glow_color, 
                          (int(self.x + self.width/2), int(self.y + self.height/2)),
                          self.width//2 + 5)
         
         # Draw enemy body
-        pygame.draw.circle(screen, ENEMY_COLOR,
+        pygame.draw.circle(surface, ENEMY_COLOR,
                          (int(self.x + self.width/2), int(self.y + self.height/2)),
                          self.width//2)
         
         # Draw enemy eyes
         eye_offset = 5
-        pygame.draw.circle(screen, WHITE,
+        pygame.draw.circle(surface, WHITE,
                          (int(self.x + self.width/2 - eye_offset), int(self.y + self.height/2 - eye_offset)), 3)
-        pygame.draw.circle(screen, WHITE,
+        pygame.draw.circle(surface, WHITE,
                          (int(self.x + self.width/2 + eye_offset), int(self.y + self.height/2 - eye_offset)), 3)
         
         # Draw enemy pupils
-        pygame.draw.circle(screen, BLACK,
+        pygame.draw.circle(surface, BLACK,
                          (int(self.x + self.width/2 - eye_offset), int(self.y + self.height/2 - eye_offset)), 1)
-        pygame.draw.circle(screen, BLACK,
+        pygame.draw.circle(surface, BLACK,
                          (int(self.x + self.width/2 + eye_offset), int(self.y + self.height/2 - eye_offset)), 1)
 
     def get_rect(self):
@@ -1847,7 +2105,9 @@ class Fireball:
         self.animation_frame += 1
         self.glow_phase = (self.glow_phase + self.glow_speed) % (2 * math.pi)
 
-    def draw(self):
+    def draw(self, surface=None):
+        if surface is None:
+            surface = screen
         # Draw fireball with glow effect
         glow_intensity = 0.5 + 0.5 * math.sin(self.glow_phase)
         glow_color = (
@@ -1857,12 +2117,12 @@ class Fireball:
         )
         
         # Draw outer glow
-        pygame.draw.circle(screen, glow_color, 
+        pygame.draw.circle(surface, glow_color, 
                          (int(self.x + self.width/2), int(self.y + self.height/2)),
                          self.width//2 + 3)
         
         # Draw fireball body
-        pygame.draw.circle(screen, FIREBALL_COLOR,
+        pygame.draw.circle(surface, FIREBALL_COLOR,
                          (int(self.x + self.width/2), int(self.y + self.height/2)),
                          self.width//2)
 
@@ -0,0 +1,76 @@
+import os
+import math
+from collections import deque
+
+MAX_ACTIVE = int(os.environ.get('GAME_MAX_ACTIVE', 200))  # Hard cap on active instances per shard
+TICK_TARGET = float(os.environ.get('GAME_TICK_TARGET_MS', 16)) / 1000  # p99 tick time to stay under
+SHED_HIGH = 0.75  # Shed more once p99 tick time passes this share of the target
+SHED_LOW = 0.4  # Restore cosmetics once p99 stays below this share
+CALM_WINDOWS_TO_RESTORE = 3
+ADMIT_STEP = 5  # Players let in per window beyond the measured capacity, while cosmetics can still go
+TICK_WINDOW = 120  # Tick samples per decision
+
+# Cosmetic work per shed level, cheapest last: (particle cap, weather, max frames per second)
+SHED_LEVELS = [
+    (None, True, None),
+    (50, False, None),
+    (0, False, 15),
+    (0, False, 10)
+]
+MAX_SHED_LEVEL = len(SHED_LEVELS) - 1
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty sequence"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class AdmissionController:
+    """Sheds cosmetic work as ticks slow down, then caps how many instances one shard may run"""
+
+    def __init__(self, max_active=MAX_ACTIVE, target=TICK_TARGET):
+        self.max_active = max_active
+        self.target = target
+        self.samples = deque(maxlen=TICK_WINDOW)
+        self.level = 0
+        self.calm_windows = 0
+        self.allowed = min(max_active, ADMIT_STEP)
+        self.tick_p99 = 0.0
+
+    def record_tick(self, seconds):
+        self.samples.append(seconds)
+
+    def evaluate(self, active):
+        """Pick the shed level and how many instances may run, from the ticks since the last call"""
+        if not self.samples:
+            return
+        self.tick_p99 = percentile(self.samples, 99)
+        mean = sum(self.samples) / len(self.samples)
+        self.samples.clear()
+
+        if self.tick_p99 > self.target * SHED_HIGH:
+            self.calm_windows = 0
+            self.level = min(self.level + 1, MAX_SHED_LEVEL)
+        elif self.tick_p99 < self.target * SHED_LOW:
+            self.calm_windows += 1
+            if self.calm_windows >= CALM_WINDOWS_TO_RESTORE and self.level > 0:
+                self.calm_windows = 0
+                self.level -= 1
+
+        # Instances that fit in the budget at the cost measured at this level
+        capacity = int(self.target * SHED_HIGH * active / mean) if active and mean > 0 else self.max_active
+        if self.level < MAX_SHED_LEVEL:
+            # Cosmetics can still be shed, so keep admitting in small steps rather than refusing
+            capacity = max(capacity, active + ADMIT_STEP)
+        self.allowed = min(self.max_active, capacity)
+
+    def can_admit(self, active):
+        return active < self.allowed
+
+    def stats(self):
+        return {
+            'shed_level': self.level,
+            'allowed': self.allowed,
+            'tick_ms_p99': self.tick_p99 * 1000
+        }
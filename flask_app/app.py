@@ -1,75 +1,153 @@
 import os
 import json
-import sqlite3
-from datetime import datetime
-from flask import Flask, render_template, request, jsonify, session
-from flask_socketio import SocketIO
+import queue
+from flask import Flask, Response, render_template, request, jsonify, session
+from flask_socketio import SocketIO, emit, join_room, leave_room, disconnect
+from threading import Lock
+
+from client_channel import ClientChannel, payload_bytes
+from sessions import SessionManager
+from leaderboard_store import shared_store, PERIODS
+from replay import ReplayVerifier
+from memory_budget import process_rss_bytes, deep_sizeof
+from metrics import (
+    REGISTRY, ACTIVE_GAMES, QUEUED_SESSIONS, SPECTATORS, CONNECTS, DISCONNECTS, EMITTED_BYTES
+)
 
 # Import game_server but don't initialize it yet
-from game_server import game_server
+from game_server import game_server, prediction_config, BROADCAST_FPS, SERVER_ACTIONS
+from world_resources import shared_world
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
+# 'threaded' ticks every game in this process, 'sharded' spreads them over worker processes
+GAME_SERVER_MODE = os.environ.get('GAME_SERVER_MODE', 'threaded')
+
+# Per-client send queues, keyed by game id while the player is connected
+channels = {}
+
+# Spectator sids per watched game, and the game each spectator is watching
+spectators = {}
+spectating = {}
+spectators_lock = Lock()
+
+# Game ids of sessions waiting for admission; they have no channel until let in
+queued = set()
+queued_lock = Lock()
+
+def spectator_room(game_id):
+    return f'spectate:{game_id}'
+
+def send_frame(sid, payload):
+    EMITTED_BYTES.inc(payload_bytes(payload))
+    socketio.emit('game_update', payload, room=sid)
+
+def emit_game_update(user_id, state):
+    spectator_state = state.pop('spectator', None)
+    if spectator_state is not None:
+        # One emit to the room; the packet is encoded once and written to every spectator
+        with spectators_lock:
+            watchers = len(spectators.get(user_id, ()))
+        EMITTED_BYTES.inc(payload_bytes(spectator_state) * watchers)
+        socketio.emit('spectator_update', spectator_state, room=spectator_room(user_id))
+    
+    channel = channels.get(user_id)
+    if channel is None:
+        return
+    
+    payload = channel.offer(state)
+    if payload is not None:
+        send_frame(channel.sid, payload)
+    if channel.keyframe_needed():
+        game_server.submit_action(user_id, 'keyframe', {})
+    
+    quality = channel.adapt()
+    if quality:
+        frame_rate, encoding = quality
+        game_server.submit_action(user_id, 'quality', {'frame_rate': frame_rate, 'encoding': encoding})
+
+if GAME_SERVER_MODE == 'sharded':
+    from shard_server import ShardedGameServer
+    game_server = ShardedGameServer(on_update=emit_game_update)
+else:
+    game_server.on_update = emit_game_update
+
+def end_game(game_id):
+    """Remove a session's game for good and tell its spectators"""
+    with spectators_lock:
+        watchers = spectators.pop(game_id, set())
+        for sid in watchers:
+            spectating.pop(sid, None)
+    if watchers:
+        socketio.emit('spectate_ended', {'game_id': game_id}, room=spectator_room(game_id))
+        socketio.close_room(spectator_room(game_id))
+    
+    with queued_lock:
+        queued.discard(game_id)
+    game_server.leave_queue(game_id)
+    channels.pop(game_id, None)
+    game_server.remove_game(game_id)
+
+# Games are keyed by session rather than sid, so a dropped connection can resume its run
+sessions = SessionManager(on_expire=end_game)
+
+def admit_queued(game_id):
+    """Start streaming to a session the server has just let in"""
+    with queued_lock:
+        queued.discard(game_id)
+    player = sessions.for_game(game_id)
+    if player is None or player.sid is None:
+        # Left before its turn came
+        end_game(game_id)
+        return
+    channels[game_id] = ClientChannel(player.sid, BROADCAST_FPS)
+    game_server.add_viewer(game_id)
+    socketio.emit('admitted', {'game_id': game_id}, room=player.sid)
+
+def notify_queued(game_id, position):
+    player = sessions.for_game(game_id)
+    if player is not None and player.sid is not None:
+        socketio.emit('queued', {'position': position}, room=player.sid)
+
+game_server.on_admit = admit_queued
+game_server.on_queue = notify_queued
+
 DB_PATH = 'leaderboard.db'
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS leaderboard (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        score INTEGER NOT NULL,
-        date TEXT NOT NULL
-    )
-    ''')
-    conn.commit()
-    conn.close()
+# Set to refuse scores that don't come with a replay
+REQUIRE_REPLAY = os.environ.get('LEADERBOARD_REQUIRE_REPLAY', '') not in ('', '0')
+
+# Opened by create_app(). Shard and replay worker processes are spawned, and they re-import
+# this module as __mp_main__, so nothing that touches the database may run at import time
+leaderboard = None
+replay_verifier = None
 
 def get_leaderboard():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM leaderboard ORDER BY score DESC LIMIT 10')
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    return leaderboard.top(10)
 
 def add_score(name, score):
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO leaderboard (name, score, date) VALUES (?, ?, ?)',
-                  (name, score, current_time))
-    conn.commit()
-    conn.close()
-
-init_db()
+    return leaderboard.add_score(name, score)
 
 def import_existing_leaderboard():
     if os.path.exists('../leaderboard.json'):
         try:
             with open('../leaderboard.json', 'r') as f:
                 scores = json.load(f)
-                
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT COUNT(*) FROM leaderboard')
-            count = cursor.fetchone()[0]
-            
-            if count == 0:  # Only import if leaderboard is empty
-                for score in scores:
-                    cursor.execute('INSERT INTO leaderboard (name, score, date) VALUES (?, ?, ?)',
-                                  (score['name'], score['score'], score['date']))
-                conn.commit()
-            conn.close()
+            leaderboard.import_rows(scores)  # Rows already on the board are skipped
         except Exception as e:
             print(f"Error importing leaderboard: {e}")
 
-import_existing_leaderboard()
+def create_app():
+    """Open the leaderboard in the serving process and return the app"""
+    global leaderboard, replay_verifier
+    if leaderboard is None:
+        leaderboard = shared_store(DB_PATH)
+        # Replay-attached scores are re-simulated in worker processes before they are inserted
+        replay_verifier = ReplayVerifier(leaderboard)
+        import_existing_leaderboard()
+    return app
 
 @app.route('/')
 def index():
@@ -79,9 +157,128 @@ def index():
 def game():
     return render_template('game.html')
 
+@app.route('/stream')
+def stream():
+    return render_template('stream.html')
+
 @app.route('/api/leaderboard', methods=['GET'])
 def get_leaderboard_api():
-    return jsonify(get_leaderboard())
+    period = request.args.get('period', 'all')
+    if period != 'all' and period not in PERIODS:
+        return jsonify({'error': f"period must be one of all, {', '.join(PERIODS)}"}), 400
+    
+    # Served from the in-memory top scores of the board or current window; the tag changes whenever they do.
+    # Archived windows are read from their rollup and have no tag
+    if period == 'all':
+        tag, scores = leaderboard.cached_top(10)
+    else:
+        tag, scores = leaderboard.window_top(period, request.args.get('window'))
+    if tag is None:
+        return jsonify(scores)
+    if request.if_none_match.contains(tag):
+        response = Response(status=304)
+    else:
+        response = jsonify(scores)
+    response.set_etag(tag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+MAX_PAGE_SIZE = 100
+
+def int_arg(name, default, minimum, maximum):
+    """A query string integer clamped to a range"""
+    value = request.args.get(name, default, type=int)
+    return max(minimum, min(maximum, default if value is None else value))
+
+@app.route('/api/leaderboard/windows', methods=['GET'])
+def leaderboard_windows_api():
+    period = request.args.get('period', 'daily')
+    if period not in PERIODS:
+        return jsonify({'error': f"period must be one of {', '.join(PERIODS)}"}), 400
+    return jsonify({'period': period, 'windows': leaderboard.window_starts(period, int_arg('limit', 30, 1, 366))})
+
+@app.route('/api/leaderboard/rank', methods=['GET'])
+def leaderboard_rank_api():
+    score = request.args.get('score', type=int)
+    if score is None:
+        return jsonify({'error': 'score is required'}), 400
+    return jsonify({'score': score, 'rank': leaderboard.rank(score), 'total': leaderboard.count()})
+
+@app.route('/api/leaderboard/around', methods=['GET'])
+def leaderboard_around_api():
+    rank = request.args.get('rank', type=int)
+    if rank is None or rank < 1:
+        return jsonify({'error': 'rank must be a positive integer'}), 400
+    radius = int_arg('radius', 5, 0, MAX_PAGE_SIZE // 2)
+    return jsonify({'rank': rank, 'scores': leaderboard.around(rank, radius)})
+
+@app.route('/api/leaderboard/page', methods=['GET'])
+def leaderboard_page_api():
+    page = int_arg('page', 1, 1, 10 ** 9)
+    per_page = int_arg('per_page', 25, 1, MAX_PAGE_SIZE)
+    return jsonify({
+        'page': page,
+        'per_page': per_page,
+        'total': leaderboard.count(),
+        'scores': leaderboard.page((page - 1) * per_page, per_page)
+    })
+
+@app.route('/api/players/<path:name>', methods=['GET'])
+def player_stats_api(name):
+    stats = leaderboard.player_stats(name)
+    if stats is None:
+        return jsonify({'error': 'No scores for this player'}), 404
+    return jsonify(stats)
+
+@app.route('/api/server/stats', methods=['GET'])
+def server_stats_api():
+    stats = game_server.get_metrics()
+    stats['sessions'] = sessions.stats()
+    stats['score_writer'] = leaderboard.writer.stats()
+    stats['replay_verifier'] = replay_verifier.stats()
+    stats['clients'] = {sid: channel.stats() for sid, channel in list(channels.items())}
+    return jsonify(stats)
+
+@app.route('/api/games', methods=['GET'])
+def list_games_api():
+    with spectators_lock:
+        counts = {game_id: len(sids) for game_id, sids in spectators.items()}
+    return jsonify([{'game_id': sid, 'spectators': counts.get(sid, 0)} for sid in list(channels)])
+
+def is_local_request():
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route('/debug/memory', methods=['GET', 'POST'])
+def debug_memory():
+    if not is_local_request():
+        return jsonify({'error': 'Only available locally'}), 403
+    
+    if request.method == 'POST':
+        budget_kb = (request.json or {}).get('budget_kb')
+        if not isinstance(budget_kb, int) or budget_kb <= 0:
+            return jsonify({'error': 'budget_kb must be a positive integer'}), 400
+        game_server.set_memory_budget(budget_kb)
+    
+    report = {
+        'rss_bytes': process_rss_bytes(),
+        'sessions': game_server.memory_report(),
+        'send_queue_bytes': {sid: channel.stats()['pending_bytes'] for sid, channel in list(channels.items())},
+        'leaderboard_store_bytes': deep_sizeof(leaderboard)
+    }
+    if GAME_SERVER_MODE != 'sharded':
+        report['shared_world_bytes'] = deep_sizeof(shared_world().surfaces())
+    return jsonify(report)
+
+@app.route('/metrics')
+def metrics():
+    if not is_local_request():
+        return jsonify({'error': 'Only available locally'}), 403
+    
+    server_metrics = game_server.get_metrics()
+    ACTIVE_GAMES.set(server_metrics['games'])
+    QUEUED_SESSIONS.set(server_metrics['queued'])
+    SPECTATORS.set(len(spectating))
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/score', methods=['POST'])
 def add_score_api():
@@ -92,38 +289,178 @@ def add_score_api():
     if not name or not score:
         return jsonify({'error': 'Name and score are required'}), 400
     
-    add_score(name, score)
-    return jsonify({'success': True})
+    replay = data.get('replay')
+    if replay is not None:
+        try:
+            # Queued for a worker; the client polls the ticket for the outcome
+            ticket = replay_verifier.submit(name, score, replay)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except queue.Full:
+            return jsonify({'error': 'Too many scores waiting for verification, try again shortly'}), 503
+        except RuntimeError as e:
+            print(f"Error queueing replay: {e}")
+            return jsonify({'error': 'Score verification is unavailable, try again shortly'}), 503
+        return jsonify({'success': True, 'status': 'verifying', 'ticket': ticket}), 202
+    if REQUIRE_REPLAY:
+        return jsonify({'error': 'Scores must come with a replay'}), 400
+    
+    try:
+        # Returns once the group commit holding this score is durable
+        score_id = add_score(name, score)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except queue.Full:
+        return jsonify({'error': 'Too many score submissions, try again shortly'}), 503
+    return jsonify({'success': True, 'id': score_id, 'rank': leaderboard.rank(score)})
+
+@app.route('/api/replay/seed', methods=['POST'])
+def replay_seed_api():
+    # Each seed backs one submitted replay, so a recorded run can't be resubmitted
+    return jsonify({'seed': replay_verifier.issue_seed()})
+
+@app.route('/api/score/<ticket>', methods=['GET'])
+def score_status_api(ticket):
+    status = replay_verifier.status(ticket)
+    if status is None:
+        return jsonify({'error': 'Unknown ticket'}), 404
+    return jsonify(status)
 
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     print(f"Client connected: {request.sid}")
-    session['user_id'] = request.sid
+    CONNECTS.inc()
+    token = auth.get('session_token') if isinstance(auth, dict) else None
+    player, resumed, stale_sid = sessions.connect(request.sid, token)
+    session['user_id'] = player.game_id
+    
+    # Resumed sessions already hold a slot or their place in line; new ones may have to wait for one
+    position = 0
+    with queued_lock:
+        if not resumed:
+            position = game_server.admit(player.game_id)
+            if position:
+                queued.add(player.game_id)
+        elif player.game_id in queued:
+            position = game_server.queue_position(player.game_id)
+    
+    if stale_sid is not None:
+        # The client is back before its old socket timed out; that socket no longer speaks for the session
+        if not position:
+            game_server.remove_viewer(player.game_id)
+        disconnect(sid=stale_sid)
+    
+    if not position:
+        channel = ClientChannel(request.sid, BROADCAST_FPS)
+        channel.set_encoding(player.encoding)
+        channels[player.game_id] = channel
+        if resumed:
+            game_server.submit_action(player.game_id, 'resume', {})
+        game_server.add_viewer(player.game_id)
+    emit('session', {
+        'session_token': player.token,
+        'game_id': player.game_id,
+        'resumed': resumed,
+        'queued': position,
+        'physics': prediction_config()
+    })
 
 @socketio.on('disconnect')
 def handle_disconnect():
     print(f"Client disconnected: {request.sid}")
-    user_id = request.sid
-    game_server.remove_game(user_id)
+    DISCONNECTS.inc()
+    stop_spectating(request.sid)
+    
+    player = sessions.for_sid(request.sid)
+    if player is not None and player.game_id in queued:
+        # Nothing to resume yet, so a queued session ends with its connection
+        sessions.discard(request.sid)
+        end_game(player.game_id)
+        return
+    
+    player = sessions.disconnect(request.sid)
+    if player is None:
+        return
+    # The game stays paused until the client resumes or the sweeper expires the session
+    channels.pop(player.game_id, None)
+    game_server.remove_viewer(player.game_id)
+    game_server.submit_action(player.game_id, 'pause', {})
+
+def stop_spectating(sid):
+    with spectators_lock:
+        game_id = spectating.pop(sid, None)
+        if game_id is None:
+            return
+        watchers = spectators.get(game_id, set())
+        watchers.discard(sid)
+        if not watchers:
+            spectators.pop(game_id, None)
+    leave_room(spectator_room(game_id), sid=sid)
+    game_server.remove_spectator(game_id)
+
+@socketio.on('spectate')
+def handle_spectate(data):
+    sid = request.sid
+    game_id = data.get('game_id')
+    player = sessions.for_sid(sid)
+    if game_id not in channels or (player and player.game_id == game_id):
+        emit('spectate_error', {'error': 'Game not found', 'game_id': game_id})
+        return
+    
+    # Spectators don't play, so the session created for this connection ends
+    player = sessions.discard(sid)
+    if player is not None:
+        end_game(player.game_id)
+    stop_spectating(sid)
+    
+    with spectators_lock:
+        spectators.setdefault(game_id, set()).add(sid)
+        spectating[sid] = game_id
+    join_room(spectator_room(game_id))
+    game_server.add_spectator(game_id)
+
+@socketio.on('stop_spectating')
+def handle_stop_spectating():
+    stop_spectating(request.sid)
 
 @socketio.on('game_action')
 def handle_game_action(data):
-    user_id = request.sid
+    player = sessions.for_sid(request.sid)
+    if player is None or player.game_id in queued:
+        return
     action = data.get('action')
+    if action in SERVER_ACTIONS:
+        return  # Driven by the connection and the client's channel, not the client
     
-    game = game_server.get_game(user_id)
-    
+    channel = channels.get(player.game_id)
     if action == 'init':
-        pass
-    elif action == 'start':
-        game.start_game()
-    elif action == 'jump':
-        game.handle_jump()
-    elif action == 'fire':
-        game.handle_fire()
+        player.encoding = data.get('encoding', 'png')
+        if channel:
+            channel.set_encoding(player.encoding)
+    
+    # Applied on the next tick; the next paced frame goes out through emit_game_update
+    game_server.submit_action(player.game_id, action, data)
+
+@socketio.on('keyframe_request')
+def handle_keyframe_request():
+    # The client missed a tile diff; the keyframe is queued with the next frame it is sent
+    player = sessions.for_sid(request.sid)
+    channel = channels.get(player.game_id) if player else None
+    if channel:
+        channel.request_keyframe()
+
+@socketio.on('frame_ack')
+def handle_frame_ack(data):
+    player = sessions.for_sid(request.sid)
+    if player is None or player.game_id in queued:
+        return
     
-    socketio.emit('game_update', game.get_state(), room=user_id)
+    channel = channels.get(player.game_id)
+    if channel and 'seq' in data:
+        payload = channel.acknowledge(data['seq'])
+        if payload is not None:
+            send_frame(request.sid, payload)
 
 if __name__ == '__main__':
     # Run the app with default server
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
+    socketio.run(create_app(), debug=True, host='0.0.0.0', port=5000)
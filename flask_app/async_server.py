@@ -0,0 +1,246 @@
+import os
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import socketio
+from aiohttp import web
+from jinja2 import Environment, FileSystemLoader
+
+from game_server import InstancePool, FPS, BROADCAST_FPS, MAX_TICK_BACKLOG, SERVER_ACTIONS, prediction_config
+from client_channel import ClientChannel
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RENDER_WORKERS = int(os.environ.get('GAME_RENDER_WORKERS', os.cpu_count() or 1))
+
+
+def spectator_room(game_id):
+    return f'spectate:{game_id}'
+
+
+class AsyncGameServer:
+    """Game server that ticks on the asyncio event loop and renders on a thread pool"""
+
+    def __init__(self, sio):
+        self.sio = sio
+        self.games = {}
+        self.channels = {}
+        self.spectators = {}  # game id -> spectator sids
+        self.spectating = {}  # spectator sid -> game id
+        self.pool = InstancePool()
+        # Removed games wait here until no render of theirs is in flight
+        self.retired = deque()
+        self.executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS)
+        self.tick_task = None
+
+    def start(self):
+        """Start ticking on the running event loop"""
+        if self.tick_task is None:
+            self.pool.start()
+            self.tick_task = asyncio.get_running_loop().create_task(self._tick_loop())
+
+    def connect(self, sid):
+        self.channels[sid] = ClientChannel(sid, BROADCAST_FPS)
+        game = self.pool.acquire(sid)
+        game.viewers += 1
+        self.games[sid] = game
+
+    async def disconnect(self, sid):
+        await self.stop_spectating(sid)
+        watchers = self.spectators.pop(sid, set())
+        for watcher in watchers:
+            self.spectating.pop(watcher, None)
+        if watchers:
+            await self.sio.emit('spectate_ended', {'game_id': sid}, room=spectator_room(sid))
+            await self.sio.close_room(spectator_room(sid))
+
+        self.channels.pop(sid, None)
+        game = self.games.pop(sid, None)
+        if game is not None:
+            self.retired.append(game)
+
+    async def spectate(self, sid, game_id):
+        """Subscribe a connection to another player's frames, returning False if that game is not running"""
+        game = self.games.get(game_id)
+        if game is None or game_id == sid:
+            return False
+
+        # Spectators don't play, so the game created for this connection is dropped
+        self.channels.pop(sid, None)
+        own_game = self.games.pop(sid, None)
+        if own_game is not None:
+            self.retired.append(own_game)
+        await self.stop_spectating(sid)
+
+        self.spectators.setdefault(game_id, set()).add(sid)
+        self.spectating[sid] = game_id
+        await self.sio.enter_room(sid, spectator_room(game_id))
+        game.spectators += 1
+        game.viewers += 1
+        return True
+
+    async def stop_spectating(self, sid):
+        game_id = self.spectating.pop(sid, None)
+        if game_id is None:
+            return
+        watchers = self.spectators.get(game_id, set())
+        watchers.discard(sid)
+        if not watchers:
+            self.spectators.pop(game_id, None)
+        await self.sio.leave_room(sid, spectator_room(game_id))
+        game = self.games.get(game_id)
+        if game is not None and game.spectators > 0:
+            game.spectators -= 1
+            game.viewers -= 1
+
+    def submit_action(self, sid, action, data):
+        game = self.games.get(sid)
+        if game is None:
+            return
+        channel = self.channels.get(sid)
+        if action == 'init' and channel:
+            channel.set_encoding(data.get('encoding', 'png'))
+        game.queue_action(action, data)
+
+    def request_keyframe(self, sid):
+        channel = self.channels.get(sid)
+        if channel:
+            channel.request_keyframe()
+
+    async def acknowledge(self, sid, data):
+        channel = self.channels.get(sid)
+        if channel and 'seq' in data:
+            payload = channel.acknowledge(data['seq'])
+            if payload is not None:
+                await self.sio.emit('game_update', payload, to=sid)
+
+    async def _tick_loop(self):
+        loop = asyncio.get_running_loop()
+        interval = 1 / FPS
+        next_tick = loop.time()
+        while True:
+            due = []
+            for game in list(self.games.values()):
+                try:
+                    game.update()
+                    if game.frame_due():
+                        due.append(game)
+                except Exception as e:
+                    print(f"Error updating game {game.user_id}: {e}")
+
+            # Encoding runs off the loop; the next tick waits so no instance is updated mid-render
+            if due:
+                states = await asyncio.gather(
+                    *(loop.run_in_executor(self.executor, game.get_state) for game in due),
+                    return_exceptions=True)
+                for game, state in zip(due, states):
+                    if isinstance(state, Exception):
+                        print(f"Error rendering game {game.user_id}: {state}")
+                        continue
+                    await self._send(game, state)
+
+            # Recycled only now, since a reused instance takes the next player's sid as its user_id
+            while self.retired:
+                self.pool.release(self.retired.popleft())
+
+            next_tick += interval
+            delay = next_tick - loop.time()
+            if delay < -interval * MAX_TICK_BACKLOG:
+                # Too far behind to catch up, drop the missed ticks
+                next_tick = loop.time()
+            await asyncio.sleep(max(0.0, delay))
+
+    async def _send(self, game, state):
+        sid = game.user_id
+        spectator_state = state.pop('spectator', None)
+        if spectator_state is not None and self.games.get(sid) is game:
+            # One emit to the room; the packet is encoded once and written to every spectator
+            await self.sio.emit('spectator_update', spectator_state, room=spectator_room(sid))
+
+        channel = self.channels.get(sid)
+        if channel is None or self.games.get(sid) is not game:
+            return
+        payload = channel.offer(state)
+        if payload is not None:
+            await self.sio.emit('game_update', payload, to=sid)
+        if channel.keyframe_needed():
+            game.queue_action('keyframe', {})
+        quality = channel.adapt()
+        if quality:
+            frame_rate, encoding = quality
+            game.queue_action('quality', {'frame_rate': frame_rate, 'encoding': encoding})
+
+
+sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*')
+app = web.Application()
+sio.attach(app)
+game_server = AsyncGameServer(sio)
+
+templates = Environment(loader=FileSystemLoader(os.path.join(BASE_DIR, 'templates')))
+
+
+def url_for(endpoint, filename=None):
+    """Enough of Flask's url_for for the shared templates"""
+    if endpoint == 'static':
+        return f'/static/{filename}'
+    return '/' if endpoint == 'index' else f'/{endpoint}'
+
+
+def render_page(name):
+    async def handler(request):
+        html = templates.get_template(name).render(url_for=url_for)
+        return web.Response(text=html, content_type='text/html')
+    return handler
+
+
+@sio.event
+async def connect(sid, environ):
+    game_server.start()
+    game_server.connect(sid)
+    # No resume token here: games on this backend end with their connection
+    await sio.emit('session', {'game_id': sid, 'resumed': False, 'physics': prediction_config()}, to=sid)
+
+
+@sio.event
+async def disconnect(sid):
+    await game_server.disconnect(sid)
+
+
+@sio.on('spectate')
+async def handle_spectate(sid, data):
+    game_id = data.get('game_id')
+    if not await game_server.spectate(sid, game_id):
+        await sio.emit('spectate_error', {'error': 'Game not found', 'game_id': game_id}, to=sid)
+
+
+@sio.on('stop_spectating')
+async def handle_stop_spectating(sid):
+    await game_server.stop_spectating(sid)
+
+
+@sio.on('game_action')
+async def handle_game_action(sid, data):
+    action = data.get('action')
+    if action in SERVER_ACTIONS:
+        return  # Driven by the server and the client's channel, not the client
+    game_server.submit_action(sid, action, data)
+
+
+@sio.on('keyframe_request')
+async def handle_keyframe_request(sid):
+    # The client missed a tile diff; the keyframe is queued with the next frame it is sent
+    game_server.request_keyframe(sid)
+
+
+@sio.on('frame_ack')
+async def handle_frame_ack(sid, data):
+    await game_server.acknowledge(sid, data)
+
+
+app.router.add_get('/', render_page('index.html'))
+app.router.add_get('/game', render_page('game.html'))
+app.router.add_get('/stream', render_page('stream.html'))
+app.router.add_static('/static', os.path.join(BASE_DIR, 'static'))
+
+if __name__ == '__main__':
+    web.run_app(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
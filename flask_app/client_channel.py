@@ -0,0 +1,180 @@
+import time
+from threading import Lock
+
+from frame_codec import ENCODINGS
+
+MAX_IN_FLIGHT = 3  # Unacknowledged frames allowed per client
+FRAME_TIMEOUT = 2.0  # seconds before an unacknowledged frame counts as lost
+ADAPT_INTERVAL = 1.0  # seconds between quality decisions
+RTT_DOWNGRADE_MS = 250
+RTT_UPGRADE_MS = 100
+GOOD_WINDOWS_TO_UPGRADE = 5
+KEYFRAME_REQUEST_INTERVAL = 1.0  # seconds between keyframes a client may ask for
+
+# Quality ladder from best to cheapest: (share of the broadcast frame rate, encoding for png clients)
+QUALITY_LEVELS = [
+    (1, 'png'),
+    (1 / 2, 'png'),
+    (1 / 2, 'jpeg'),
+    (1 / 3, 'jpeg'),
+    (1 / 6, 'jpeg')
+]
+
+
+def payload_bytes(state):
+    """Encoded frame bytes carried by a game_update payload"""
+    if 'tiles' in state:
+        return sum(len(tile['data']) for tile in state['tiles']['tiles'])
+    return len(state.get('frame', ''))
+
+
+class ClientChannel:
+    """Bounded per-client send queue where the newest frame replaces any waiting one"""
+
+    def __init__(self, sid, frame_rate, max_in_flight=MAX_IN_FLIGHT):
+        self.sid = sid
+        self.frame_rate = frame_rate  # The server's broadcast rate, the top of the ladder
+        self.max_in_flight = max_in_flight
+        self.encoding = 'png'
+        self.seq = 0
+        self.in_flight = {}  # seq -> send time
+        self.pending = None  # Latest frame waiting for a free slot
+        self.rtt_ms = None
+        self.level = 0
+        self.dropped = 0
+        self.window_dropped = 0
+        self.window_lost = 0
+        self.good_windows = 0
+        self.tiles_broken = False
+        self.keyframe_requested_at = None
+        self.last_adapt = time.monotonic()
+        self.lock = Lock()
+
+    def offer(self, state):
+        """Return the payload to send now, or None if the frame had to wait"""
+        with self.lock:
+            self._expire_in_flight()
+            if len(self.in_flight) >= self.max_in_flight:
+                if self.pending is not None:
+                    self.dropped += 1
+                    self.window_dropped += 1
+                    if 'tiles' in state and 'tiles' in self.pending:
+                        state = self._merge_tiles(self.pending, state)
+                self.pending = state
+                return None
+            return self._stamp(state)
+
+    def set_encoding(self, encoding):
+        """Record the codec the client asked for, falling back to png for anything unknown"""
+        self.encoding = encoding if encoding in ENCODINGS else 'png'
+
+    def request_keyframe(self):
+        """A client missed a tile diff; honoured at most once per KEYFRAME_REQUEST_INTERVAL"""
+        with self.lock:
+            now = time.monotonic()
+            if self.keyframe_requested_at is not None and now - self.keyframe_requested_at < KEYFRAME_REQUEST_INTERVAL:
+                return
+            self.keyframe_requested_at = now
+            self.tiles_broken = True
+
+    def keyframe_needed(self):
+        """Whether a tile frame was lost since the last call, so the encoder owes a keyframe"""
+        with self.lock:
+            needed = self.tiles_broken
+            self.tiles_broken = False
+            return needed
+
+    def acknowledge(self, seq):
+        """Record a client ack and return a waiting frame that can now be sent"""
+        with self.lock:
+            sent_at = self.in_flight.pop(seq, None)
+            if sent_at is not None:
+                sample = (time.monotonic() - sent_at) * 1000
+                self.rtt_ms = sample if self.rtt_ms is None else self.rtt_ms * 0.8 + sample * 0.2
+            if self.pending is not None and len(self.in_flight) < self.max_in_flight:
+                state = self.pending
+                self.pending = None
+                return self._stamp(state)
+            return None
+
+    def adapt(self):
+        """Move along the quality ladder, returning the new (fps, encoding) on a change"""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_adapt < ADAPT_INTERVAL:
+                return None
+            self.last_adapt = now
+
+            struggling = self.window_lost > 0 or self.window_dropped > 0 or \
+                (self.rtt_ms is not None and self.rtt_ms > RTT_DOWNGRADE_MS)
+            healthy = self.window_lost == 0 and self.window_dropped == 0 and \
+                self.rtt_ms is not None and self.rtt_ms < RTT_UPGRADE_MS
+            self.window_lost = 0
+            self.window_dropped = 0
+
+            level = self.level
+            if struggling:
+                self.good_windows = 0
+                level = min(level + 1, len(QUALITY_LEVELS) - 1)
+            elif healthy:
+                self.good_windows += 1
+                if self.good_windows >= GOOD_WINDOWS_TO_UPGRADE:
+                    self.good_windows = 0
+                    level = max(level - 1, 0)
+
+            if level == self.level:
+                return None
+            self.level = level
+            return self.quality()
+
+    def quality(self):
+        """Frame rate and encoding for the current level"""
+        share, encoding = QUALITY_LEVELS[self.level]
+        frame_rate = max(1, round(self.frame_rate * share))
+        # Clients streaming tiles keep their codec and only lose frame rate
+        if self.encoding != 'png':
+            encoding = self.encoding
+        return frame_rate, encoding
+
+    def stats(self):
+        """Snapshot for the stats endpoint"""
+        with self.lock:
+            return {
+                'rtt_ms': self.rtt_ms,
+                'level': self.level,
+                'in_flight': len(self.in_flight),
+                'pending_bytes': payload_bytes(self.pending) if self.pending else 0,
+                'dropped': self.dropped
+            }
+
+    def _stamp(self, state):
+        self.seq += 1
+        self.in_flight[self.seq] = time.monotonic()
+        payload = dict(state)
+        payload['seq'] = self.seq
+        return payload
+
+    def _merge_tiles(self, waiting, state):
+        """Fold a waiting tile frame into the one replacing it, since each diff builds on the last"""
+        tiles = state['tiles']
+        if tiles['keyframe']:
+            return state
+        if tiles['base_frame_id'] != waiting['tiles']['frame_id']:
+            # Not the frame this diff was encoded on, so neither can be sent as it is
+            self.tiles_broken = True
+            return state
+
+        merged = {(tile['x'], tile['y']): tile for tile in waiting['tiles']['tiles']}
+        merged.update({(tile['x'], tile['y']): tile for tile in tiles['tiles']})
+        state = dict(state)
+        state['tiles'] = dict(tiles,
+                              keyframe=waiting['tiles']['keyframe'],
+                              base_frame_id=waiting['tiles']['base_frame_id'],
+                              tiles=list(merged.values()))
+        return state
+
+    def _expire_in_flight(self):
+        cutoff = time.monotonic() - FRAME_TIMEOUT
+        for seq in [s for s, sent_at in self.in_flight.items() if sent_at < cutoff]:
+            del self.in_flight[seq]
+            self.window_lost += 1
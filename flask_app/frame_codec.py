@@ -0,0 +1,90 @@
+import base64
+import io
+import zlib
+
+import pygame
+
+ENCODINGS = ('png', 'jpeg', 'tiles')
+TILE_SIZE = 40
+KEYFRAME_INTERVAL = 120  # Encoded frames between full frames: 4 seconds at the default 30 fps
+
+
+def encode_png(surface):
+    """Encode a surface as a base64 PNG string"""
+    buffer = io.BytesIO()
+    pygame.image.save(surface, buffer, 'PNG')
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def encode_jpeg(surface):
+    """Encode a surface as a base64 JPEG string, cheaper to send than PNG for busy frames"""
+    buffer = io.BytesIO()
+    pygame.image.save(surface, buffer, 'JPG')
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+class TileDiffEncoder:
+    """Encodes frames as the tiles that changed since the previous encoded frame.
+
+    Each diff names the frame it applies on top of as base_frame_id. A client that
+    no longer holds that frame has missed one and asks for a keyframe instead of
+    patching the wrong picture.
+    """
+
+    def __init__(self, width, height, tile_size=TILE_SIZE, keyframe_interval=KEYFRAME_INTERVAL):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.tile_rects = [
+            pygame.Rect(x, y, min(tile_size, width - x), min(tile_size, height - y))
+            for y in range(0, height, tile_size)
+            for x in range(0, width, tile_size)
+        ]
+        self.reset()
+
+    def reset(self):
+        """Forget everything the client has seen so the next frame is a keyframe"""
+        self.frame_id = 0
+        self.sent_hashes = None
+        self.frames_since_keyframe = 0
+
+    def request_keyframe(self):
+        """Make the next encoded frame a keyframe"""
+        self.sent_hashes = None
+
+    def encode(self, surface):
+        """Encode a surface into a tile diff payload"""
+        self.frame_id += 1
+        keyframe = self.sent_hashes is None or self.frames_since_keyframe >= self.keyframe_interval
+
+        hashes = []
+        tiles = []
+        for index, rect in enumerate(self.tile_rects):
+            tile = surface.subsurface(rect)
+            tile_hash = zlib.crc32(pygame.image.tostring(tile, 'RGB'))
+            hashes.append(tile_hash)
+
+            if keyframe or self.sent_hashes[index] != tile_hash:
+                tiles.append({
+                    'x': rect.x,
+                    'y': rect.y,
+                    'data': encode_png(tile.copy())
+                })
+
+        if keyframe:
+            self.frames_since_keyframe = 0
+        else:
+            self.frames_since_keyframe += 1
+
+        self.sent_hashes = hashes
+
+        return {
+            'frame_id': self.frame_id,
+            'base_frame_id': None if keyframe else self.frame_id - 1,
+            'keyframe': keyframe,
+            'width': self.width,
+            'height': self.height,
+            'tile_size': self.tile_size,
+            'tiles': tiles
+        }
@@ -1,11 +1,8 @@
 import os
 import sys
-import json
 import random
-import base64
-import io
-import sqlite3
-from datetime import datetime
+import math
+from collections import deque
 from threading import Thread, Lock
 import time
 
@@ -27,16 +24,53 @@ except pygame.error:
 
 from flappy_bird import (
     SCREEN_WIDTH, SCREEN_HEIGHT, FPS, PIPE_SPAWN_INTERVAL,
-    Bird, Pipe, PowerUp, Enemy, Fireball, WeatherSystem, Cityscape,
+    Bird, Pipe, PowerUp, Enemy, Fireball,
     DonkeyKong, DeathCutscene, LuigiBattle, WinningCutscene,
-    check_collision, draw_score, calculate_pipe_speed
+    calculate_pipe_speed, BLACK
 )
+from frame_codec import ENCODINGS, TileDiffEncoder, encode_png, encode_jpeg
+from world_resources import WorldView, shared_world
+from memory_budget import MEMORY_BUDGET_KB, DEFAULT_PARTICLE_CAP, MIN_PARTICLE_CAP, deep_sizeof
+from admission import AdmissionController, SHED_LEVELS
+from leaderboard_store import shared_store
+from metrics import TICK_SECONDS, TICK_LAG_SECONDS, RENDER_SECONDS, ENCODE_SECONDS
+
+MAX_TICK_BACKLOG = 5  # Ticks we try to catch up on before dropping them
+BROADCAST_FPS = int(os.environ.get('GAME_FRAME_RATE', 30))  # Frames sent to viewers per second
+# Actions the server queues itself, from the connection and the client's channel; never taken from a socket
+SERVER_ACTIONS = ('pause', 'resume', 'quality', 'keyframe')
+
+INPUT_HISTORY = FPS * 2  # Applied inputs remembered per instance, for acks to predicting clients
+
+POOL_MIN_SIZE = int(os.environ.get('GAME_POOL_MIN', 2))
+POOL_MAX_SIZE = int(os.environ.get('GAME_POOL_MAX', 64))
+POOL_IDLE_TTL = 300  # seconds a pooled instance may sit unused beyond the target size
+POOL_WARM_SECONDS = 10  # Keep enough instances for this many seconds of connects
+POOL_MAINTAIN_INTERVAL = 1.0  # seconds
+
+class TickScheduler:
+    """Fixed-rate tick scheduler that corrects for drift instead of sleeping blindly"""
+    
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_tick = time.perf_counter()
+    
+    def wait(self):
+        """Sleep until the next tick is due and return how late it started in seconds"""
+        self.next_tick += self.interval
+        now = time.perf_counter()
+        delay = self.next_tick - now
+        if delay > 0:
+            time.sleep(delay)
+        elif -delay > self.interval * MAX_TICK_BACKLOG:
+            # Too far behind to catch up, drop the missed ticks
+            self.next_tick = now
+        return max(0.0, time.perf_counter() - self.next_tick)
 
 class ServerLeaderboard:
     def __init__(self, db_path='leaderboard.db'):
-        self.db_path = db_path
-        self.scores = []
-        self.init_db()
+        self.store = shared_store(db_path)
+        self.scores = []  # Only the top ten; nothing here needs more
         self.load_scores()
         self.previous_top_score = self.get_top_score()
         self.previous_top_name = self.get_top_name()
@@ -46,30 +80,9 @@ class ServerLeaderboard:
         self.beat_message_scale = 1.0
         self.beat_message_growing = True
     
-    def init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS leaderboard (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            score INTEGER NOT NULL,
-            date TEXT NOT NULL
-        )
-        ''')
-        conn.commit()
-        conn.close()
-
     def load_scores(self):
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM leaderboard ORDER BY score DESC')
-            rows = cursor.fetchall()
-            conn.close()
-            
-            self.scores = [dict(row) for row in rows]
+            self.scores = self.store.top(10)
         except Exception as e:
             print(f"Error loading leaderboard from database: {e}")
             self.scores = []
@@ -78,15 +91,7 @@ class ServerLeaderboard:
         pass
 
     def add_score(self, name, score):
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO leaderboard (name, score, date) VALUES (?, ?, ?)',
-                      (name, score, current_time))
-        conn.commit()
-        conn.close()
-        
+        self.store.add_score(name, score)
         self.load_scores()
 
     def get_top_score(self):
@@ -128,22 +133,19 @@ class GameInstance:
     """Server-side game instance that handles game logic and rendering"""
     
     def __init__(self, user_id):
-        self.user_id = user_id
-        self.screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
         self.clock = pygame.time.Clock()
         self.game_state = 'START'  # START, PLAYING, OVER, LEADERBOARD
         self.score = 0
-        self.high_score = 0
         
         self.bird = Bird()
         self.pipes = []
         self.power_ups = []
         self.enemies = []
         self.fireballs = []
-        self.weather = WeatherSystem()
-        self.cityscape = Cityscape()
+        # Background, weather, fonts and the render surface are shared per process
+        self.world = WorldView(shared_world())
         self.donkey_kong = DonkeyKong()
-        self.death_cutscene = DeathCutscene()
+        self.death_cutscene = DeathCutscene(None)
         self.luigi_battle = LuigiBattle()
         self.winning_cutscene = WinningCutscene()
         
@@ -154,221 +156,721 @@ class GameInstance:
         self.last_update = pygame.time.get_ticks()
         self.frame_count = 0
         
-        self.lock = Lock()
+        self.tile_encoder = TileDiffEncoder(SCREEN_WIDTH, SCREEN_HEIGHT)
+        
+        # Socket handlers only append here; the update thread drains it once per tick
+        self.inputs = deque()
+        # (input_seq, tick, action) for recent client inputs, newest last
+        self.input_history = deque(maxlen=INPUT_HISTORY)
+        
+        self.reset_session(user_id)
+    
+    def reset_session(self, user_id):
+        """Hand the instance to a new session, keeping the expensive world objects"""
+        self.user_id = user_id
+        self.high_score = 0
+        self.encoding = 'png'  # png, jpeg or tiles
+        self.tile_encoder.reset()
+        self.world.reset()
+        
+        self.inputs.clear()
+        self.input_history.clear()
+        self.tick = 0
+        self.predict = False  # The client draws the bird itself from predicted state
+        self.input_count = 0
+        self.input_latency_total = 0.0
+        self.input_latency_max = 0.0
+        
+        # Frames are only rendered while someone is watching
+        self.viewers = 0
+        self.spectators = 0  # Included in viewers; they share one full frame per broadcast
+        self.paused = False  # Set while the player is disconnected but may still resume
+        self.paused_at = 0
+        self.shed_level = 0  # Set by the server each tick from its admission controller
+        self.frame_interval = max(1, round(FPS / BROADCAST_FPS))
+        self.ticks_until_frame = 0
+        
+        # Cosmetic particle lists are trimmed to this while the instance is over budget
+        self.memory_budget = MEMORY_BUDGET_KB * 1024
+        self.particle_cap = DEFAULT_PARTICLE_CAP
+        self.memory = {}
+        self.last_frame_bytes = 0
+        self.ticks_until_memory_check = FPS
         
         self.reset_game()
     
     def reset_game(self):
         """Reset the game state"""
-        with self.lock:
-            self.bird.reset()
-            self.pipes = []
-            self.power_ups = []
-            self.enemies = []
-            self.fireballs = []
-            self.score = 0
-            self.last_pipe_spawn = pygame.time.get_ticks()
-            self.pipe_speed = 2
-            self.game_state = 'START'
+        self.bird.reset()
+        self.pipes = []
+        self.power_ups = []
+        self.enemies = []
+        self.fireballs = []
+        self.score = 0
+        self.last_pipe_spawn = pygame.time.get_ticks()
+        self.pipe_speed = 2
+        self.game_state = 'START'
     
     def start_game(self):
         """Start the game"""
-        with self.lock:
-            if self.game_state == 'START':
-                self.game_state = 'PLAYING'
-                self.reset_game()
+        if self.game_state in ('START', 'OVER'):
+            self.reset_game()
+            self.game_state = 'PLAYING'
     
     def handle_jump(self):
         """Handle jump action"""
-        with self.lock:
-            if self.game_state == 'PLAYING':
-                self.bird.jump()
+        if self.game_state == 'PLAYING':
+            self.bird.jump()
     
     def handle_fire(self):
         """Handle fire action"""
-        with self.lock:
-            if self.game_state == 'PLAYING' and self.bird.can_shoot:
-                self.fireballs.append(Fireball(self.bird.x, self.bird.y))
+        if self.game_state == 'PLAYING':
+            self.fireballs.append(Fireball(self.bird.x + self.bird.width, self.bird.y + self.bird.height / 2))
+    
+    def queue_action(self, action, data):
+        """Queue a client action to be applied at the start of the next tick"""
+        self.inputs.append((action, data, time.perf_counter()))
+    
+    def apply_inputs(self):
+        """Apply every queued action and record how long each one waited"""
+        now = time.perf_counter()
+        while self.inputs:
+            action, data, queued_at = self.inputs.popleft()
+            latency = now - queued_at
+            self.input_count += 1
+            self.input_latency_total += latency
+            self.input_latency_max = max(self.input_latency_max, latency)
+            
+            self.handle_action(action, data)
+            if 'input_seq' in data:
+                self.input_history.append((data['input_seq'], self.tick, action))
+    
+    def particle_lists(self):
+        """Every cosmetic particle list owned by this instance"""
+        lists = [self.bird.particles, self.bird.trail_particles, self.death_cutscene.particles]
+        lists.extend(pipe.particles for pipe in self.pipes)
+        return lists
+    
+    def trim_particles(self):
+        """Drop the oldest particles beyond the current cap"""
+        cap = self.particle_cap
+        shed_cap = SHED_LEVELS[self.shed_level][0]
+        if shed_cap is not None:
+            cap = min(cap, shed_cap)
+        for particles in self.particle_lists():
+            if len(particles) > cap:
+                del particles[:len(particles) - cap]
+    
+    def memory_report(self):
+        """Approximate bytes held by this instance, by subsystem"""
+        # Particles first so they are not counted again inside the objects that own them
+        subsystems = {
+            'world': self.world,
+            'particles': self.particle_lists(),
+            'entities': [self.bird, self.pipes, self.power_ups, self.enemies, self.fireballs],
+            'cutscenes': [self.donkey_kong, self.death_cutscene, self.luigi_battle, self.winning_cutscene],
+            'leaderboard': self.leaderboard,
+            'frame_buffers': self.tile_encoder.sent_hashes,
+            'inputs': self.inputs
+        }
+        # Shared world resources, the canvas and the leaderboard store are reported once per
+        # process, not per instance; the store's rank counts alone grow with every row
+        seen = {id(self.world.world), id(self.world.world.canvas()), id(self.leaderboard.store)}
+        report = {name: deep_sizeof(obj, seen) for name, obj in subsystems.items()}
+        report['frame_buffers'] += self.last_frame_bytes
+        return report
+    
+    def memory_summary(self):
+        """Latest memory report with its total, budget and the particle cap it led to"""
+        return {
+            'subsystems': self.memory,
+            'total': sum(self.memory.values()),
+            'budget': self.memory_budget,
+            'particle_cap': self.particle_cap
+        }
+    
+    def check_memory(self):
+        """Refresh the memory report and shrink or restore the particle cap against the budget"""
+        self.memory = self.memory_report()
+        total = sum(self.memory.values())
+        if total > self.memory_budget and self.particle_cap > MIN_PARTICLE_CAP:
+            self.particle_cap //= 2
+        elif total < self.memory_budget // 2 and self.particle_cap < DEFAULT_PARTICLE_CAP:
+            self.particle_cap = min(DEFAULT_PARTICLE_CAP, max(1, self.particle_cap * 2))
     
     def update(self):
         """Update game state"""
-        with self.lock:
-            current_time = pygame.time.get_ticks()
-            dt = current_time - self.last_update
-            self.last_update = current_time
+        self.apply_inputs()
+        if self.paused:
+            return
+        self.tick += 1
+        
+        self.ticks_until_memory_check -= 1
+        if self.ticks_until_memory_check <= 0:
+            self.ticks_until_memory_check = FPS
+            self.check_memory()
+        
+        current_time = pygame.time.get_ticks()
+        dt = current_time - self.last_update
+        self.last_update = current_time
+        
+        if self.game_state == 'PLAYING':
+            self.bird.update(playing=True)
             
-            if self.game_state == 'PLAYING':
-                self.bird.update()
+            if current_time - self.last_pipe_spawn > PIPE_SPAWN_INTERVAL:
+                self.last_pipe_spawn = current_time
                 
-                if current_time - self.last_pipe_spawn > PIPE_SPAWN_INTERVAL:
-                    self.last_pipe_spawn = current_time
-                    
-                    self.pipe_speed = calculate_pipe_speed(self.score)
-                    
-                    new_pipe = Pipe(self.pipe_speed)
-                    self.pipes.append(new_pipe)
-                    
-                    if random.random() < 0.2:  # 20% chance
-                        power_up_type = random.choice(['shield', 'slow', 'points'])
-                        self.power_ups.append(PowerUp(SCREEN_WIDTH, random.randint(100, SCREEN_HEIGHT - 100), power_up_type))
-                    
-                    if random.random() < 0.15:  # 15% chance
-                        self.enemies.append(Enemy(SCREEN_WIDTH, random.randint(100, SCREEN_HEIGHT - 100)))
+                self.pipe_speed, _ = calculate_pipe_speed(self.score)
                 
-                for pipe in self.pipes[:]:
-                    pipe.update()
-                    
-                    if not pipe.passed and pipe.x + pipe.width < self.bird.x:
-                        pipe.passed = True
-                        self.score += 1
-                    
-                    if pipe.x < -pipe.width:
-                        self.pipes.remove(pipe)
+                new_pipe = Pipe(self.pipe_speed)
+                self.pipes.append(new_pipe)
                 
-                for power_up in self.power_ups[:]:
-                    power_up.update()
-                    
-                    if check_collision(self.bird.get_rect(), power_up.get_rect()):
-                        if power_up.type == 'shield':
-                            self.bird.activate_shield()
-                        elif power_up.type == 'slow':
-                            for pipe in self.pipes:
-                                pipe.speed *= 0.5
-                        elif power_up.type == 'points':
-                            self.score += 5
-                        
-                        self.power_ups.remove(power_up)
-                    
-                    if power_up.x < -power_up.width:
-                        self.power_ups.remove(power_up)
+                if random.random() < 0.2:  # 20% chance
+                    power_up_type = random.choice(['shield', 'slow', 'points'])
+                    self.power_ups.append(PowerUp(SCREEN_WIDTH, random.randint(100, SCREEN_HEIGHT - 100), power_up_type))
                 
-                for enemy in self.enemies[:]:
-                    enemy.update()
-                    
-                    if check_collision(self.bird.get_rect(), enemy.get_rect()):
-                        if not self.bird.shield_active:
-                            self.game_over()
-                        else:
-                            self.enemies.remove(enemy)
-                    
-                    for fireball in self.fireballs[:]:
-                        if check_collision(fireball.get_rect(), enemy.get_rect()):
-                            self.enemies.remove(enemy)
-                            self.fireballs.remove(fireball)
-                            self.score += 2
-                            break
+                if random.random() < 0.15:  # 15% chance
+                    self.enemies.append(Enemy(SCREEN_WIDTH, random.randint(100, SCREEN_HEIGHT - 100)))
+            
+            for pipe in self.pipes[:]:
+                pipe.update()
+                
+                if not pipe.scored and pipe.x + pipe.width < self.bird.x:
+                    pipe.scored = True
+                    self.score += 1
+                
+                if pipe.x < -pipe.width:
+                    self.pipes.remove(pipe)
+            
+            for power_up in self.power_ups[:]:
+                power_up.update()
+                
+                if self.bird.get_rect().colliderect(power_up.get_rect()):
+                    if power_up.power_type == 'shield':
+                        self.bird.activate_shield()
+                    elif power_up.power_type == 'slow':
+                        for pipe in self.pipes:
+                            pipe.speed *= 0.5
+                    elif power_up.power_type == 'points':
+                        self.score += 5
                     
-                    if enemy.x < -enemy.width:
+                    self.power_ups.remove(power_up)
+                
+                elif power_up.x < -power_up.width:
+                    self.power_ups.remove(power_up)
+            
+            for enemy in self.enemies[:]:
+                enemy.update()
+                
+                if self.bird.get_rect().colliderect(enemy.get_rect()):
+                    if not self.bird.shield_active:
+                        self.game_over()
+                    else:
                         self.enemies.remove(enemy)
+                        continue
                 
+                hit = False
                 for fireball in self.fireballs[:]:
-                    fireball.update()
-                    
-                    if fireball.x > SCREEN_WIDTH:
+                    if fireball.get_rect().colliderect(enemy.get_rect()):
+                        self.enemies.remove(enemy)
                         self.fireballs.remove(fireball)
+                        self.score += 2
+                        hit = True
+                        break
                 
-                self.cityscape.update()
-                self.weather.update()
-                
-                for pipe in self.pipes:
-                    if check_collision(self.bird.get_rect(), pipe.get_top_rect()) or \
-                       check_collision(self.bird.get_rect(), pipe.get_bottom_rect()):
-                        if not self.bird.shield_active:
-                            self.game_over()
+                if not hit and enemy.x < -enemy.width:
+                    self.enemies.remove(enemy)
+            
+            for fireball in self.fireballs[:]:
+                fireball.update()
                 
-                if self.bird.y < 0 or self.bird.y > SCREEN_HEIGHT:
-                    self.game_over()
+                if fireball.x > SCREEN_WIDTH:
+                    self.fireballs.remove(fireball)
+            
+            self.world.update(weather=SHED_LEVELS[self.shed_level][1])
+            
+            for pipe in self.pipes:
+                if self.bird.get_rect().colliderect(pipe.get_top_rect()) or \
+                   self.bird.get_rect().colliderect(pipe.get_bottom_rect()):
+                    if not self.bird.shield_active:
+                        self.game_over()
             
-            elif self.game_state == 'OVER':
-                self.death_cutscene.update()
+            if self.bird.y < 0 or self.bird.y > SCREEN_HEIGHT:
+                self.game_over()
+        
+        elif self.game_state == 'OVER':
+            self.death_cutscene.update()
+        
+        self.trim_particles()
     
     def game_over(self):
         """Handle game over"""
-        with self.lock:
-            self.game_state = 'OVER'
-            self.death_cutscene.start(self.bird.x, self.bird.y)
-            
-            if self.score > self.high_score:
-                self.high_score = self.score
+        self.game_state = 'OVER'
+        self.death_cutscene.start((self.bird.x, self.bird.y))
+        
+        if self.score > self.high_score:
+            self.high_score = self.score
+    
+    def handle_action(self, action, data):
+        """Apply a client game_action"""
+        if action == 'init':
+            self.set_encoding(data.get('encoding', 'png'))
+            self.predict = bool(data.get('predict'))
+        elif action == 'start':
+            self.start_game()
+        elif action == 'jump':
+            self.handle_jump()
+        elif action == 'fire':
+            self.handle_fire()
+        elif action == 'keyframe':
+            # The client missed a tile diff and can't patch the next one
+            self.tile_encoder.request_keyframe()
+        elif action == 'quality':
+            self.set_frame_rate(data.get('frame_rate', BROADCAST_FPS))
+            self.set_encoding(data.get('encoding', self.encoding))
+        elif action == 'pause':
+            self.pause()
+        elif action == 'resume':
+            self.resume()
+    
+    def pause(self):
+        """Freeze the game while its player is disconnected"""
+        if not self.paused:
+            self.paused = True
+            self.paused_at = pygame.time.get_ticks()
+    
+    def resume(self):
+        """Continue after a reconnect, sending a full keyframe at once at full quality"""
+        if self.paused:
+            self.paused = False
+            # Pipes keep their spacing as if the pause never happened
+            self.last_pipe_spawn += pygame.time.get_ticks() - self.paused_at
+        # The new connection holds none of the old one's frames
+        self.tile_encoder.reset()
+        self.set_frame_rate(BROADCAST_FPS)
+        self.ticks_until_frame = 0
+    
+    def frame_due(self):
+        """Whether this tick should render a frame, paced to the broadcast rate"""
+        if self.viewers == 0 or self.paused:
+            return False
+        self.ticks_until_frame -= 1
+        if self.ticks_until_frame > 0:
+            return False
+        self.ticks_until_frame = self.frame_interval
+        max_fps = SHED_LEVELS[self.shed_level][2]
+        if max_fps:
+            self.ticks_until_frame = max(self.frame_interval, round(FPS / max_fps))
+        return True
+    
+    def set_frame_rate(self, frame_rate):
+        """Change how often frames are rendered for this game, at most BROADCAST_FPS"""
+        if not isinstance(frame_rate, (int, float)) or isinstance(frame_rate, bool) or not frame_rate >= 1:
+            frame_rate = BROADCAST_FPS
+        self.frame_interval = max(1, round(FPS / min(frame_rate, BROADCAST_FPS)))
+    
+    def set_encoding(self, encoding):
+        """Select how frames are sent to the client"""
+        if encoding not in ENCODINGS:
+            encoding = 'png'
+        if encoding != self.encoding:
+            self.encoding = encoding
+            self.tile_encoder.reset()
+    
+    def draw(self):
+        """Draw the current game state onto the shared canvas and return it"""
+        screen = self.world.world.canvas()
+        
+        self.world.draw(screen)
+        
+        for pipe in self.pipes:
+            pipe.draw(screen)
+        
+        for power_up in self.power_ups:
+            power_up.draw(screen)
+        
+        for enemy in self.enemies:
+            enemy.draw(screen)
+        
+        for fireball in self.fireballs:
+            fireball.draw(screen)
+        
+        # Predicting clients draw the bird where they expect it, until the death cutscene
+        if not self.predict or self.game_state == 'OVER':
+            self.bird.draw(screen)
+        
+        self.draw_hud(screen)
+        
+        if self.game_state == 'OVER':
+            self.death_cutscene.screen = screen
+            self.death_cutscene.draw()
+        
+        return screen
+    
+    def draw_hud(self, screen):
+        """Draw the score in the top right corner"""
+        font = self.world.world.font(36)
+        score_text = font.render(f"Score: {self.score}", True, BLACK)
+        screen.blit(score_text, score_text.get_rect(topright=(SCREEN_WIDTH - 10, 10)))
     
     def render(self):
         """Render the game state to a surface and return as base64 image"""
-        with self.lock:
-            self.screen.fill((135, 206, 235))  # Sky blue
-            
-            self.cityscape.draw()
-            
-            self.weather.draw()
-            
-            for pipe in self.pipes:
-                pipe.draw(self.screen)
-            
-            for power_up in self.power_ups:
-                power_up.draw(self.screen)
-            
-            for enemy in self.enemies:
-                enemy.draw(self.screen)
-            
-            for fireball in self.fireballs:
-                fireball.draw(self.screen)
-            
-            self.bird.draw(self.screen)
-            
-            draw_score(self.screen, self.score)
-            
-            if self.game_state == 'OVER':
-                self.death_cutscene.draw(self.screen)
-            
-            image_data = pygame.image.tostring(self.screen, 'RGB')
-            image = pygame.image.fromstring(image_data, (SCREEN_WIDTH, SCREEN_HEIGHT), 'RGB')
-            
-            buffer = io.BytesIO()
-            pygame.image.save(image, buffer, 'PNG')
-            buffer.seek(0)
-            
-            img_base64 = base64.b64encode(buffer.read()).decode('utf-8')
-            
-            return img_base64
+        return self.encode_frame(encode_png, 'png')
+    
+    def render_tiles(self):
+        """Render the game state and return only the tiles that changed"""
+        return self.encode_frame(self.tile_encoder.encode, 'tiles')
+    
+    def encode_frame(self, encode, frame_format):
+        """Draw a frame and encode it, timing both halves"""
+        start = time.perf_counter()
+        surface = self.draw()
+        drawn = time.perf_counter()
+        data = encode(surface)
+        RENDER_SECONDS.observe(drawn - start)
+        ENCODE_SECONDS.observe(time.perf_counter() - drawn, (frame_format,))
+        return data
     
     def get_state(self):
         """Get the current game state"""
+        state = {
+            'game_state': self.game_state,
+            'score': self.score,
+            'high_score': self.high_score,
+            'ack': self.state_ack()
+        }
+        
+        if self.encoding == 'tiles':
+            state['tiles'] = self.render_tiles()
+            self.last_frame_bytes = sum(len(tile['data']) for tile in state['tiles']['tiles'])
+        elif self.encoding == 'jpeg':
+            state['frame'] = self.encode_frame(encode_jpeg, 'jpeg')
+            state['format'] = 'jpeg'
+            self.last_frame_bytes = len(state['frame'])
+        else:
+            state['frame'] = self.render()
+            state['format'] = 'png'
+            self.last_frame_bytes = len(state['frame'])
+        
+        if self.spectators:
+            state['spectator'] = self.spectator_state(state)
+        return state
+    
+    def state_ack(self):
+        """Authoritative bird state after the latest tick and the last client input it includes"""
+        input_seq, input_tick = self.input_history[-1][:2] if self.input_history else (0, 0)
+        return {
+            'tick': self.tick,
+            'input_seq': input_seq,
+            'input_tick': input_tick,
+            'bird': {'y': self.bird.y, 'velocity': self.bird.velocity}
+        }
+    
+    def spectator_state(self, state):
+        """Full frame for spectators, encoded once however many are watching"""
+        if 'frame' in state:
+            frame, frame_format = state['frame'], state['format']
+        else:
+            # Tile diffs depend on the frames the player already has, so spectators get the canvas that was just drawn
+            with ENCODE_SECONDS.time(('jpeg',)):
+                frame = encode_jpeg(self.world.world.canvas())
+            frame_format = 'jpeg'
+        return {
+            'game_id': self.user_id,
+            'game_state': self.game_state,
+            'score': self.score,
+            'high_score': self.high_score,
+            'frame': frame,
+            'format': frame_format
+        }
+
+def prediction_config():
+    """Bird physics a client needs to predict motion between authoritative acks"""
+    bird = Bird()
+    return {
+        'tick_rate': FPS,
+        'screen_width': SCREEN_WIDTH,
+        'screen_height': SCREEN_HEIGHT,
+        'x': bird.x,
+        'start_y': bird.y,
+        'width': bird.width,
+        'height': bird.height,
+        'gravity': bird.gravity,
+        'jump_strength': bird.jump_strength
+    }
+
+class InstancePool:
+    """Pre-built GameInstances handed out on connect and taken back on disconnect"""
+    
+    def __init__(self, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, idle_ttl=POOL_IDLE_TTL):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.idle = deque()  # (instance, released_at), most recently released on the right
+        self.target_size = min_size
+        self.connect_rate = 0.0  # Smoothed connects per second
+        self.connects = 0
+        self.created = 0
+        self.evicted = 0
+        self.lock = Lock()
+        self.maintain_thread = None
+    
+    def start(self):
+        """Start the background thread that warms and trims the pool"""
+        with self.lock:
+            if self.maintain_thread is None:
+                self.maintain_thread = Thread(target=self._maintain_loop)
+                self.maintain_thread.daemon = True
+                self.maintain_thread.start()
+    
+    def acquire(self, user_id):
+        """Take a warm instance for a session, building one only if the pool is empty"""
+        with self.lock:
+            self.connects += 1
+            instance = self.idle.pop()[0] if self.idle else None
+        
+        if instance is None:
+            return self._build(user_id)
+        instance.reset_session(user_id)
+        return instance
+    
+    def release(self, instance):
+        """Return an instance that is no longer being ticked"""
+        instance.reset_session(None)
+        with self.lock:
+            if len(self.idle) < self.max_size:
+                self.idle.append((instance, time.monotonic()))
+    
+    def maintain(self):
+        """Resize the target from the connect rate, evict stale instances and pre-build missing ones"""
+        with self.lock:
+            self.connect_rate = self.connect_rate * 0.7 + self.connects / POOL_MAINTAIN_INTERVAL * 0.3
+            self.connects = 0
+            wanted = math.ceil(self.connect_rate * POOL_WARM_SECONDS)
+            self.target_size = max(self.min_size, min(self.max_size, wanted))
+            
+            cutoff = time.monotonic() - self.idle_ttl
+            while len(self.idle) > self.target_size and self.idle[0][1] < cutoff:
+                self.idle.popleft()
+                self.evicted += 1
+            missing = self.target_size - len(self.idle)
+        
+        for _ in range(missing):
+            instance = self._build(None)
+            with self.lock:
+                self.idle.append((instance, time.monotonic()))
+    
+    def stats(self):
+        """Pool size and sizing inputs"""
         with self.lock:
             return {
-                'game_state': self.game_state,
-                'score': self.score,
-                'high_score': self.high_score,
-                'frame': self.render()
+                'idle': len(self.idle),
+                'target': self.target_size,
+                'connect_rate': self.connect_rate,
+                'created': self.created,
+                'evicted': self.evicted
             }
+    
+    def _build(self, user_id):
+        instance = GameInstance(user_id)
+        with self.lock:
+            self.created += 1
+        return instance
+    
+    def _maintain_loop(self):
+        while True:
+            try:
+                self.maintain()
+            except Exception as e:
+                print(f"Error maintaining instance pool: {e}")
+            time.sleep(POOL_MAINTAIN_INTERVAL)
 
 class GameServer:
     """Server that manages multiple game instances"""
     
-    def __init__(self):
+    def __init__(self, on_update=None):
         self.games = {}
         self.lock = Lock()
-        self.update_thread = Thread(target=self._update_loop)
-        self.update_thread.daemon = True
-        self.update_thread.start()
+        self.update_thread = None
+        self.memory_budget = MEMORY_BUDGET_KB * 1024
+        self.pool = InstancePool()
+        # Removed games wait here until the tick thread can safely recycle them
+        self.retired = deque()
+        self.on_update = on_update  # Called with (user_id, state) for every broadcast frame
+        
+        self.admission = AdmissionController()
+        self.waiting = deque()  # Sessions queued for a free slot, oldest first
+        self.on_admit = None  # Called with user_id when a queued session is let in
+        self.on_queue = None  # Called with (user_id, position) for every queued session once a second
+    
+    def start(self):
+        """Start the update thread if it is not already running"""
+        with self.lock:
+            if self.update_thread is None:
+                self.update_thread = Thread(target=self._update_loop)
+                self.update_thread.daemon = True
+                self.update_thread.start()
+        self.pool.start()
     
     def get_game(self, user_id):
         """Get or create a game instance for a user"""
+        self.start()
+        with self.lock:
+            game = self.games.get(user_id)
+        if game is not None:
+            return game
+        
+        # Taken from the pool outside the server lock so a cold build never stalls other sessions
+        game = self.pool.acquire(user_id)
+        game.memory_budget = self.memory_budget
+        with self.lock:
+            existing = self.games.setdefault(user_id, game)
+        if existing is not game:
+            self.pool.release(game)
+        return existing
+    
+    def admit(self, user_id):
+        """Start a game for a new session if there is room, returning its queue position or 0"""
+        self.start()
+        with self.lock:
+            if self.waiting or not self.admission.can_admit(len(self.games)):
+                self.waiting.append(user_id)
+                return len(self.waiting)
+        self.get_game(user_id)
+        return 0
+    
+    def queue_position(self, user_id):
+        """A queued session's place in line, or 0 if it is not queued"""
+        with self.lock:
+            return self.waiting.index(user_id) + 1 if user_id in self.waiting else 0
+    
+    def leave_queue(self, user_id):
+        """Forget a queued session"""
         with self.lock:
-            if user_id not in self.games:
-                self.games[user_id] = GameInstance(user_id)
-            return self.games[user_id]
+            if user_id in self.waiting:
+                self.waiting.remove(user_id)
+    
+    def add_viewer(self, user_id):
+        """Start broadcasting frames for a game"""
+        game = self.get_game(user_id)
+        with self.lock:
+            game.viewers += 1
+    
+    def remove_viewer(self, user_id):
+        """Stop broadcasting frames for a game once nobody is watching"""
+        with self.lock:
+            game = self.games.get(user_id)
+            if game and game.viewers > 0:
+                game.viewers -= 1
+    
+    def add_spectator(self, user_id):
+        """Broadcast a running game to one more spectator, returning False if it is not running"""
+        with self.lock:
+            game = self.games.get(user_id)
+            if game is None:
+                return False
+            game.spectators += 1
+            game.viewers += 1
+        return True
+    
+    def remove_spectator(self, user_id):
+        """Drop a spectator from a game"""
+        with self.lock:
+            game = self.games.get(user_id)
+            if game and game.spectators > 0:
+                game.spectators -= 1
+                game.viewers -= 1
+    
+    def submit_action(self, user_id, action, data):
+        """Queue a game_action for the next tick without waiting on it"""
+        self.get_game(user_id).queue_action(action, data)
     
     def remove_game(self, user_id):
         """Remove a game instance"""
         with self.lock:
-            if user_id in self.games:
-                del self.games[user_id]
+            game = self.games.pop(user_id, None)
+        if game is not None:
+            self.retired.append(game)
+    
+    def get_metrics(self):
+        """Input-to-tick latency across all game instances"""
+        with self.lock:
+            games = list(self.games.values())
+        count = sum(game.input_count for game in games)
+        total = sum(game.input_latency_total for game in games)
+        return {
+            'games': len(games),
+            'pool': self.pool.stats(),
+            'admission': self.admission.stats(),
+            'queued': len(self.waiting),
+            'inputs': count,
+            'input_latency_ms_avg': total / count * 1000 if count else 0.0,
+            'input_latency_ms_max': max((game.input_latency_max for game in games), default=0.0) * 1000
+        }
+    
+    def set_memory_budget(self, budget_kb):
+        """Change the per-instance memory budget for current and future games"""
+        self.memory_budget = budget_kb * 1024
+        with self.lock:
+            for game in self.games.values():
+                game.memory_budget = self.memory_budget
+    
+    def memory_report(self):
+        """Latest per-session memory breakdown, refreshed once a second by the tick thread"""
+        with self.lock:
+            games = list(self.games.values())
+        return {game.user_id: game.memory_summary() for game in games}
+    
+    def _admit_waiting(self):
+        """Let queued sessions in while there is room and tell the rest where they stand"""
+        with self.lock:
+            active = len(self.games)
+            admitted = []
+            while self.waiting and self.admission.can_admit(active + len(admitted)):
+                admitted.append(self.waiting.popleft())
+            waiting = list(self.waiting)
+        
+        for user_id in admitted:
+            self.get_game(user_id)
+            if self.on_admit:
+                self.on_admit(user_id)
+        if self.on_queue:
+            for position, user_id in enumerate(waiting, 1):
+                self.on_queue(user_id, position)
     
     def _update_loop(self):
         """Update all game instances in a separate thread"""
+        scheduler = TickScheduler(FPS)
+        ticks_until_admission = FPS
         while True:
+            # Snapshot so handlers creating games never wait on a whole tick
             with self.lock:
-                for game in self.games.values():
+                games = list(self.games.values())
+            tick_start = time.perf_counter()
+            for game in games:
+                try:
+                    game.shed_level = self.admission.level
                     game.update()
-            time.sleep(1 / FPS)  # Target FPS
+                    # Inputs since the last frame are coalesced into this one
+                    if game.frame_due() and self.on_update:
+                        self.on_update(game.user_id, game.get_state())
+                except Exception as e:
+                    print(f"Error updating game {game.user_id}: {e}")
+            while self.retired:
+                self.pool.release(self.retired.popleft())
+            tick_time = time.perf_counter() - tick_start
+            TICK_SECONDS.observe(tick_time)
+            self.admission.record_tick(tick_time)
+            
+            ticks_until_admission -= 1
+            if ticks_until_admission <= 0:
+                ticks_until_admission = FPS
+                self.admission.evaluate(len(games))
+                try:
+                    self._admit_waiting()
+                except Exception as e:
+                    print(f"Error admitting queued sessions: {e}")
+            
+            TICK_LAG_SECONDS.observe(scheduler.wait())
 
 game_server = GameServer()
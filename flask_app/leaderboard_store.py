@@ -0,0 +1,769 @@
+import os
+import time
+import queue
+import secrets
+import sqlite3
+import heapq
+from operator import itemgetter
+from bisect import bisect_left, insort
+from collections import Counter
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+from threading import Thread, Lock
+
+from metrics import (
+    SQLITE_QUERY_SECONDS, SCORE_QUEUE_DEPTH, SCORE_COMMIT_SECONDS, SCORE_BATCH_SIZE, SCORE_ACK_SECONDS
+)
+
+POOL_SIZE = int(os.environ.get('LEADERBOARD_DB_POOL', 8))  # Idle connections kept per database
+CACHE_SIZE = int(os.environ.get('LEADERBOARD_CACHE_SIZE', 100))  # Top scores kept in memory
+COMMIT_WINDOW = float(os.environ.get('LEADERBOARD_COMMIT_WINDOW_MS', 5)) / 1000  # Longest a score waits for company
+COMMIT_BATCH = int(os.environ.get('LEADERBOARD_COMMIT_BATCH', 500))  # Most scores per commit
+WRITE_QUEUE_SIZE = int(os.environ.get('LEADERBOARD_WRITE_QUEUE', 10000))  # Submissions beyond this are refused
+MAX_SCORE = int(os.environ.get('LEADERBOARD_MAX_SCORE', 1000000))  # Rank counts are kept per score up to this
+MAX_NAME_LENGTH = int(os.environ.get('LEADERBOARD_MAX_NAME', 32))  # Characters in a player name
+WINDOW_SIZE = int(os.environ.get('LEADERBOARD_WINDOW_SIZE', 100))  # Top scores rolled up per daily or weekly window
+PERIODS = ('daily', 'weekly')
+STATS_LOOKUP_CHUNK = 500  # Names per player_stats lookup, under SQLite's bound-parameter limit
+BUSY_TIMEOUT_MS = 5000
+
+# Applied to every new connection. WAL lets readers run alongside the writer, and
+# synchronous=FULL syncs the WAL on every commit so an acknowledged score survives
+# power loss. The ScoreWriter's group commit pays that sync once per batch
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=FULL',
+    f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}',
+    'PRAGMA cache_size=-8192',  # KiB
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456'
+)
+
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS leaderboard (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        score INTEGER NOT NULL,
+        date TEXT NOT NULL
+    )
+    ''',
+    # Top-N reads walk this index and stop after N rows instead of sorting the table
+    'CREATE INDEX IF NOT EXISTS idx_leaderboard_score ON leaderboard (score DESC, id)',
+    # Best WINDOW_SIZE rows of every daily and weekly window, kept up to date on insert.
+    # Finished windows stay here as the archive
+    '''
+    CREATE TABLE IF NOT EXISTS leaderboard_rollups (
+        period TEXT NOT NULL,
+        window_start TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        score INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        PRIMARY KEY (period, window_start, id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_rollups_score ON leaderboard_rollups (period, window_start, score DESC, id)',
+    # Bulk imports skip rows already on the board by this key
+    'CREATE INDEX IF NOT EXISTS idx_leaderboard_entry ON leaderboard (date, name, score)',
+    # How far through each bulk import source has been committed, for resuming
+    '''
+    CREATE TABLE IF NOT EXISTS leaderboard_imports (
+        source TEXT PRIMARY KEY,
+        position INTEGER NOT NULL,
+        imported INTEGER NOT NULL,
+        updated TEXT NOT NULL
+    )
+    ''',
+    # Running totals per player, updated with every insert so a profile is one primary key lookup.
+    # Streaks are runs of consecutive days with at least one score
+    '''
+    CREATE TABLE IF NOT EXISTS player_stats (
+        name TEXT PRIMARY KEY,
+        games INTEGER NOT NULL,
+        total_score INTEGER NOT NULL,
+        best_score INTEGER NOT NULL,
+        best_id INTEGER NOT NULL,
+        best_date TEXT NOT NULL,
+        first_played TEXT NOT NULL,
+        last_played TEXT NOT NULL,
+        current_streak INTEGER NOT NULL,
+        longest_streak INTEGER NOT NULL
+    ) WITHOUT ROWID
+    '''
+)
+
+STATS_COLUMNS = ('name', 'games', 'total_score', 'best_score', 'best_id', 'best_date',
+                 'first_played', 'last_played', 'current_streak', 'longest_streak')
+stats_values = itemgetter(*STATS_COLUMNS)
+
+# SQL for window_start(), used to rebuild the rollups from the leaderboard table
+WINDOW_START_SQL = {
+    'daily': 'substr(date, 1, 10)',
+    'weekly': "date(substr(date, 1, 10), '-6 days', 'weekday 1')"
+}
+
+TRIM_WINDOW = '''
+DELETE FROM leaderboard_rollups WHERE period = ? AND window_start = ? AND id IN (
+    SELECT id FROM leaderboard_rollups WHERE period = ? AND window_start = ?
+    ORDER BY score DESC, id LIMIT -1 OFFSET ?
+)
+'''
+
+
+def now_string():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def window_start(period, date):
+    """The day a score's daily or weekly window starts on, as YYYY-MM-DD; weeks start on Monday"""
+    day = date[:10]
+    return day if period == 'daily' else _week_start(day)
+
+
+@lru_cache(maxsize=4096)
+def _week_start(day):
+    day = datetime.strptime(day, '%Y-%m-%d').date()
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+@lru_cache(maxsize=4096)
+def _day_before(day):
+    return (datetime.strptime(day, '%Y-%m-%d').date() - timedelta(days=1)).isoformat()
+
+
+def add_to_stats(stats, row):
+    """A player's stats with one more committed row counted, starting a new record for None.
+
+    Streaks follow the order rows arrive in: a row dated before the player's
+    latest one counts towards everything but them.
+    """
+    if stats is None:
+        return {
+            'name': row['name'], 'games': 1, 'total_score': row['score'],
+            'best_score': row['score'], 'best_id': row['id'], 'best_date': row['date'],
+            'first_played': row['date'], 'last_played': row['date'],
+            'current_streak': 1, 'longest_streak': 1
+        }
+    stats['games'] += 1
+    stats['total_score'] += row['score']
+    if row['score'] > stats['best_score']:
+        stats['best_score'], stats['best_id'], stats['best_date'] = row['score'], row['id'], row['date']
+    stats['first_played'] = min(stats['first_played'], row['date'])
+
+    day, last_day = row['date'][:10], stats['last_played'][:10]
+    if day > last_day:
+        stats['current_streak'] = stats['current_streak'] + 1 if _day_before(day) == last_day else 1
+        stats['longest_streak'] = max(stats['longest_streak'], stats['current_streak'])
+    stats['last_played'] = max(stats['last_played'], row['date'])
+    return stats
+
+
+def best_first(row):
+    """Sort key putting rows in board order"""
+    return -row['score'], row['id']
+
+
+def validate_score(score):
+    if not isinstance(score, int) or isinstance(score, bool) or not 0 <= score <= MAX_SCORE:
+        raise ValueError(f'Score must be a whole number from 0 to {MAX_SCORE}')
+
+
+def validate_name(name):
+    if not isinstance(name, str) or not 0 < len(name) <= MAX_NAME_LENGTH:
+        raise ValueError(f'Name must be text of 1 to {MAX_NAME_LENGTH} characters')
+
+
+def normalize_row(record):
+    """A {name, score, date} row from an imported record, or None if it is not a valid score.
+
+    Scores may be strings, as CSV gives them; any other fields are ignored.
+    """
+    try:
+        name = str(record['name'])
+        score = int(record['score'])
+        date = str(record['date'])
+        validate_name(name)
+        validate_score(score)
+        if len(date) != 19 or date[10] != ' ':
+            raise ValueError(date)
+        datetime.fromisoformat(date)  # YYYY-MM-DD HH:MM:SS, as now_string() writes
+    except (KeyError, TypeError, ValueError):
+        return None
+    return {'name': name, 'score': score, 'date': date}
+
+
+class TopScores:
+    """The best K rows in score order, with a version that changes whenever they do"""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = []  # (-score, id, row), so plain sorting puts the best first
+        # Versions restart with the process, so tags also carry a per-process epoch
+        self.epoch = secrets.token_hex(4)
+        self.version = 0
+        self.lock = Lock()
+
+    def load(self, rows):
+        """Replace the contents with rows read from the database"""
+        with self.lock:
+            self.entries = sorted((-row['score'], row['id'], row) for row in rows)[:self.size]
+            self.version += 1
+
+    def offer(self, row):
+        """Add a newly written row if it makes the top K, returning whether anything changed"""
+        key = (-row['score'], row['id'])
+        with self.lock:
+            if len(self.entries) >= self.size and key >= self.entries[-1][:2]:
+                return False
+            i = bisect_left(self.entries, key)
+            if i < len(self.entries) and self.entries[i][:2] == key:
+                return False  # Already loaded from the database
+            insort(self.entries, key + (row,))
+            del self.entries[self.size:]
+            self.version += 1
+            return True
+
+    def top(self, limit):
+        """(version tag, copies of the best rows)"""
+        with self.lock:
+            return f'{self.epoch}-{self.version}', [dict(entry[2]) for entry in self.entries[:limit]]
+
+
+class ScoreCounts:
+    """Fenwick tree of how many rows hold each score, for O(log n) rank and position lookups"""
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.counts = [0] * size
+        self.tree = [0] * (size + 1)
+        self.total = 0
+        self.lock = Lock()
+
+    def load(self, score_counts):
+        """Replace the contents with (score, count) pairs"""
+        with self.lock:
+            self.counts = [0] * self.size
+            self.total = 0
+            for score, count in score_counts:
+                if score >= self.size:
+                    self._resize(score)
+                self.counts[score] += count
+                self.total += count
+            self._rebuild()
+
+    def add(self, score, count=1):
+        self.add_many({score: count})
+
+    def add_many(self, score_counts):
+        """Add a {score: count} mapping, rebuilding in linear time when that is cheaper"""
+        with self.lock:
+            top = max(score_counts, default=0)
+            resized = top >= self.size
+            if resized:
+                self._resize(top)
+            if resized or len(score_counts) * self.size.bit_length() > self.size:
+                for score, count in score_counts.items():
+                    self.counts[score] += count
+                    self.total += count
+                self._rebuild()
+                return
+            for score, count in score_counts.items():
+                self.counts[score] += count
+                self.total += count
+                i = score + 1
+                while i <= self.size:
+                    self.tree[i] += count
+                    i += i & -i
+
+    def _resize(self, score):
+        size = self.size
+        while size <= score:
+            size *= 2
+        self.counts.extend([0] * (size - self.size))
+        self.size = size
+
+    def _rebuild(self):
+        # Linear-time construction: each node passes its sum to its parent
+        self.tree = [0] + self.counts
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+
+    def _at_most(self, score):
+        """Rows with a score of at most this"""
+        i = min(score + 1, self.size)
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def rank(self, score):
+        """Competition rank a score has, or would have: one more than the rows above it"""
+        with self.lock:
+            return self.total - self._at_most(score) + 1
+
+    def locate(self, position):
+        """(score, rows above that score) for the row at a zero-based position, best first"""
+        with self.lock:
+            # The position-th row from the top is the target-th from the bottom
+            target = self.total - position
+            index = 0
+            step = 1 << self.size.bit_length()
+            while step:
+                nxt = index + step
+                if nxt <= self.size and self.tree[nxt] < target:
+                    index = nxt
+                    target -= self.tree[nxt]
+                step >>= 1
+            score = index  # Tree index index + 1 holds this score
+            return score, self.total - self._at_most(score)
+
+
+class ScoreWriter:
+    """Background thread that commits queued scores in batches.
+
+    The first score of a batch waits at most the commit window for others to
+    join it, so a burst of submissions shares one transaction and one sync.
+    """
+
+    def __init__(self, store, window=COMMIT_WINDOW, max_batch=COMMIT_BATCH, max_pending=WRITE_QUEUE_SIZE):
+        self.store = store
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.thread = None
+        self.lock = Lock()
+        self.commits = 0
+        self.last_batch = 0
+        self.last_commit_ms = 0.0
+
+    def start(self):
+        """Start the writer thread if it is not already running"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = Thread(target=self._write_loop)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def submit(self, row):
+        """Queue a row, returning a Future that resolves to its id once committed.
+
+        Raises queue.Full when the backlog is at its limit.
+        """
+        self.start()
+        future = Future()
+        self.pending.put_nowait((row, future, time.perf_counter()))
+        SCORE_QUEUE_DEPTH.set(self.pending.qsize())
+        return future
+
+    def stats(self):
+        return {
+            'queued': self.pending.qsize(),
+            'commits': self.commits,
+            'last_batch': self.last_batch,
+            'last_commit_ms': self.last_commit_ms
+        }
+
+    def _next_batch(self):
+        batch = [self.pending.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.pending.get(timeout=remaining) if remaining > 0 else self.pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self):
+        while True:
+            batch = self._next_batch()
+            SCORE_QUEUE_DEPTH.set(self.pending.qsize())
+            start = time.perf_counter()
+            try:
+                rows = self.store.insert_many([row for row, _, _ in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    print(f"Error committing score: {e}")
+                    batch[0][1].set_exception(e)
+                    continue
+                # One bad row fails the whole transaction, so only it should fail
+                print(f"Error committing {len(batch)} scores, retrying one at a time: {e}")
+                batch, rows = self._commit_each(batch)
+
+            done = time.perf_counter()
+            self.commits += 1
+            self.last_batch = len(batch)
+            self.last_commit_ms = (done - start) * 1000
+            try:
+                self.store.remember(rows)
+            except Exception as e:
+                # The rows are durable, so their submitters must not be told otherwise and retry
+                print(f"Error caching {len(rows)} committed scores: {e}")
+            for (_, future, submitted), row in zip(batch, rows):
+                SCORE_ACK_SECONDS.observe(done - submitted)
+                future.set_result(row['id'])
+
+    def _commit_each(self, batch):
+        """Commit a failed batch row by row, failing the futures of the rows that still fail.
+
+        Returns the entries that committed and their rows with ids.
+        """
+        committed = []
+        rows = []
+        for entry in batch:
+            row, future, _ = entry
+            try:
+                rows.extend(self.store.insert_many([row]))
+            except Exception as e:
+                print(f"Error committing score: {e}")
+                future.set_exception(e)
+                continue
+            committed.append(entry)
+        return committed, rows
+
+
+class LeaderboardStore:
+    """Leaderboard table behind a pool of tuned connections"""
+
+    def __init__(self, db_path, pool_size=POOL_SIZE):
+        self.db_path = db_path
+        # Connections are checked out for one call at a time, so each is only ever used by one thread
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+        with self.connection() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+
+        # Every insert writes through, so top-N reads up to its size never touch the database.
+        # Writes made by other processes are not seen until they restart
+        self.top_scores = TopScores()
+        self.top_scores.load(self._query_top(self.top_scores.size))
+        self.score_counts = ScoreCounts()
+        self.score_counts.load(self._query_score_counts())
+
+        # period -> (window start, TopScores) for the window in progress; older windows are
+        # only read from the rollup table
+        self.windows = {}
+        self.windows_lock = Lock()
+        with self.connection() as conn:
+            rolled_up = conn.execute('SELECT 1 FROM leaderboard_rollups LIMIT 1').fetchone()
+            if not rolled_up and conn.execute('SELECT 1 FROM leaderboard LIMIT 1').fetchone():
+                # A database from before rollups existed
+                self._rebuild_rollups(conn)
+                conn.commit()
+            counted = conn.execute('SELECT 1 FROM player_stats LIMIT 1').fetchone()
+            if not counted and conn.execute('SELECT 1 FROM leaderboard LIMIT 1').fetchone():
+                # A database from before player stats existed
+                self._rebuild_player_stats(conn)
+                conn.commit()
+
+        self.writer = ScoreWriter(self)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection, opening one if every pooled one is in use"""
+        try:
+            conn = self.pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            try:
+                self.pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def submit_score(self, name, score, date=None):
+        """Queue a score for the next group commit, returning a Future for its row id"""
+        validate_name(name)
+        validate_score(score)
+        return self.writer.submit({'name': name, 'score': score, 'date': date or now_string()})
+
+    def add_score(self, name, score, date=None):
+        """Insert one score and return its row id once it is durable"""
+        return self.submit_score(name, score, date).result()
+
+    def insert_many(self, rows):
+        """Insert rows in one transaction, returning them with their ids in order.
+
+        The in-memory boards only see the rows once they are passed to remember().
+        """
+        with SCORE_COMMIT_SECONDS.time(), self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = self._insert(conn, rows)
+            conn.commit()
+        SCORE_BATCH_SIZE.observe(len(rows))
+        return rows
+
+    def _insert(self, conn, rows):
+        """Insert rows, their rollups and their players' stats in the open transaction, returning
+        the rows with their ids.
+
+        The transaction must hold the write lock from its start, which keeps the
+        AUTOINCREMENT ids of the rows consecutive.
+        """
+        if not rows:
+            return []
+        conn.executemany('INSERT INTO leaderboard (name, score, date) VALUES (?, ?, ?)',
+                         [(row['name'], row['score'], row['date']) for row in rows])
+        last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        rows = [dict(row, id=row_id) for row, row_id in zip(rows, range(last_id - len(rows) + 1, last_id + 1))]
+        self._roll_up(conn, rows)
+        self._update_player_stats(conn, rows)
+        return rows
+
+    def remember(self, rows):
+        """Write committed rows through to the in-memory boards and rank counts"""
+        # Only a batch's own best rows can make a board, which matters for bulk imports
+        for row in heapq.nsmallest(self.top_scores.size, rows, key=best_first):
+            self.top_scores.offer(row)
+        self.score_counts.add_many(Counter(row['score'] for row in rows))
+        for period in PERIODS:
+            start, top_scores = self._current_window(period)
+            in_window = (row for row in rows if window_start(period, row['date']) == start)
+            for row in heapq.nsmallest(top_scores.size, in_window, key=best_first):
+                top_scores.offer(row)
+
+    def _roll_up(self, conn, rows):
+        """Add rows to their daily and weekly rollups and trim each touched window back to size"""
+        windows = {}
+        for row in rows:
+            for period in PERIODS:
+                windows.setdefault((period, window_start(period, row['date'])), []).append(row)
+
+        entries = []
+        for (period, start), window_rows in windows.items():
+            if len(window_rows) > WINDOW_SIZE:
+                # Rows outside the batch's own top N for a window can't make the window's
+                window_rows = heapq.nsmallest(WINDOW_SIZE, window_rows, key=best_first)
+            entries.extend((period, start, row['id'], row['name'], row['score'], row['date']) for row in window_rows)
+        conn.executemany('INSERT INTO leaderboard_rollups (period, window_start, id, name, score, date) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', entries)
+        for period, start in windows:
+            conn.execute(TRIM_WINDOW, (period, start, period, start, WINDOW_SIZE))
+
+    def _rebuild_rollups(self, conn):
+        conn.execute('DELETE FROM leaderboard_rollups')
+        for period, start_sql in WINDOW_START_SQL.items():
+            conn.execute(f'''
+                INSERT INTO leaderboard_rollups (period, window_start, id, name, score, date)
+                SELECT ?, window_start, id, name, score, date FROM (
+                    SELECT {start_sql} AS window_start, id, name, score, date, ROW_NUMBER() OVER (
+                        PARTITION BY {start_sql} ORDER BY score DESC, id
+                    ) AS place FROM leaderboard
+                ) WHERE place <= ?
+            ''', (period, WINDOW_SIZE))
+        with self.windows_lock:
+            self.windows.clear()
+
+    def _update_player_stats(self, conn, rows):
+        """Fold rows into their players' stats: one read and one write per player in the batch"""
+        names = list({row['name'] for row in rows})
+        stats = {}
+        for i in range(0, len(names), STATS_LOOKUP_CHUNK):
+            chunk = names[i:i + STATS_LOOKUP_CHUNK]
+            for record in conn.execute(f"SELECT {', '.join(STATS_COLUMNS)} FROM player_stats "
+                                       f"WHERE name IN ({', '.join('?' * len(chunk))})", chunk):
+                stats[record[0]] = dict(zip(STATS_COLUMNS, record))
+        for row in sorted(rows, key=lambda row: (row['date'], row['id'])):
+            stats[row['name']] = add_to_stats(stats.get(row['name']), row)
+        self._write_player_stats(conn, stats.values())
+
+    def _write_player_stats(self, conn, records):
+        conn.executemany(f"INSERT OR REPLACE INTO player_stats ({', '.join(STATS_COLUMNS)}) "
+                         f"VALUES ({', '.join('?' * len(STATS_COLUMNS))})",
+                         [stats_values(record) for record in records])
+
+    def _rebuild_player_stats(self, conn):
+        # Replays every row in date order through the same code that maintains the stats on insert
+        conn.execute('DELETE FROM player_stats')
+        stats = {}
+        for row in conn.execute('SELECT id, name, score, date FROM leaderboard ORDER BY date, id'):
+            stats[row['name']] = add_to_stats(stats.get(row['name']), row)
+        self._write_player_stats(conn, stats.values())
+
+    def player_stats(self, name):
+        """A player's games, total, average and best score, play streaks and best rank, or None"""
+        with SQLITE_QUERY_SECONDS.time(('player',)), self.connection() as conn:
+            record = conn.execute('SELECT * FROM player_stats WHERE name = ?', (name,)).fetchone()
+        if record is None:
+            return None
+        stats = dict(record)
+        stats['average_score'] = stats['total_score'] / stats['games']
+        if stats['last_played'][:10] < _day_before(now_string()[:10]):
+            stats['current_streak'] = 0  # No score yesterday or today, so the run has ended
+        stats['best_rank'] = self.rank(stats['best_score'])
+        return stats
+
+    def _current_window(self, period):
+        """(start, TopScores) for the window in progress, loading it when a new one has begun"""
+        start = window_start(period, now_string())
+        with self.windows_lock:
+            current = self.windows.get(period)
+            if current is None or current[0] != start:
+                top_scores = TopScores(WINDOW_SIZE)
+                top_scores.load(self._query_window(period, start, WINDOW_SIZE))
+                current = self.windows[period] = (start, top_scores)
+            return current
+
+    def _query_window(self, period, start, limit):
+        with SQLITE_QUERY_SECONDS.time(('window',)), self.connection() as conn:
+            rows = conn.execute('SELECT id, name, score, date FROM leaderboard_rollups '
+                                'WHERE period = ? AND window_start = ? ORDER BY score DESC, id LIMIT ?',
+                                (period, start, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def window_top(self, period, start=None, limit=10):
+        """(version tag or None, best scores) of a daily or weekly window, the current one by default"""
+        current_start, top_scores = self._current_window(period)
+        if start in (None, current_start) and limit <= top_scores.size:
+            return top_scores.top(limit)
+        return None, self._query_window(period, start or current_start, min(limit, WINDOW_SIZE))
+
+    def window_starts(self, period, limit=30):
+        """Start dates of the most recent windows that have scores, newest first"""
+        with self.connection() as conn:
+            rows = conn.execute('SELECT DISTINCT window_start FROM leaderboard_rollups WHERE period = ? '
+                                'ORDER BY window_start DESC LIMIT ?', (period, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def top(self, limit=10):
+        """The best scores, highest first"""
+        return self.cached_top(limit)[1]
+
+    def cached_top(self, limit=10):
+        """(version tag or None, best scores), from memory when the limit fits in the cache"""
+        if limit <= self.top_scores.size:
+            return self.top_scores.top(limit)
+        return None, self._query_top(limit)
+
+    def _query_top(self, limit):
+        with SQLITE_QUERY_SECONDS.time(('top',)), self.connection() as conn:
+            rows = conn.execute('SELECT id, name, score, date FROM leaderboard '
+                                'ORDER BY score DESC, id LIMIT ?', (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def _query_score_counts(self):
+        with self.connection() as conn:
+            return conn.execute('SELECT score, COUNT(*) FROM leaderboard GROUP BY score').fetchall()
+
+    def count(self):
+        return self.score_counts.total
+
+    def rank(self, score):
+        """Global rank a score has or would have, 1 being the best"""
+        return self.score_counts.rank(score)
+
+    def page(self, offset, limit):
+        """Rows at zero-based positions offset to offset + limit - 1, best first, each with its rank"""
+        if offset >= self.score_counts.total or limit <= 0:
+            return []
+        # The counts give the score at the offset, and the index seeks straight to it;
+        # only rows tied on that score are skipped one by one
+        score, above = self.score_counts.locate(offset)
+        with SQLITE_QUERY_SECONDS.time(('page',)), self.connection() as conn:
+            rows = conn.execute('SELECT id, name, score, date FROM leaderboard WHERE score = ? '
+                                'ORDER BY id LIMIT ? OFFSET ?', (score, limit, offset - above)).fetchall()
+            if len(rows) < limit:
+                rows += conn.execute('SELECT id, name, score, date FROM leaderboard WHERE score < ? '
+                                     'ORDER BY score DESC, id LIMIT ?', (score, limit - len(rows))).fetchall()
+        return [dict(row, rank=self.score_counts.rank(row['score'])) for row in rows]
+
+    def around(self, rank, radius):
+        """Rows within radius positions of a rank"""
+        start = max(0, rank - 1 - radius)
+        return self.page(start, rank + radius - start)
+
+    def import_rows(self, records, source=None, position=None):
+        """Insert the valid records that are not already on the board, in one transaction.
+
+        A row counts as already present when its date, name and score all match.
+        When a source is given, position is committed with the rows, so an
+        interrupted import can resume after it. Returns (imported, duplicates, rejected).
+        """
+        rows = [normalize_row(record) for record in records]
+        rejected = rows.count(None)
+        with SCORE_COMMIT_SECONDS.time(), self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # One join against the entry index finds every key already on the board
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS import_keys (date TEXT, name TEXT, score INTEGER)')
+            conn.executemany('INSERT INTO import_keys VALUES (?, ?, ?)',
+                             [(row['date'], row['name'], row['score']) for row in rows if row is not None])
+            seen = {tuple(key) for key in conn.execute(
+                'SELECT k.date, k.name, k.score FROM import_keys k JOIN leaderboard l '
+                'ON l.date = k.date AND l.name = k.name AND l.score = k.score')}
+            conn.execute('DELETE FROM import_keys')
+
+            new_rows = []
+            for row in rows:
+                if row is None:
+                    continue
+                key = (row['date'], row['name'], row['score'])
+                if key not in seen:
+                    seen.add(key)
+                    new_rows.append(row)
+            new_rows = self._insert(conn, new_rows)
+            if source is not None:
+                conn.execute('INSERT INTO leaderboard_imports (source, position, imported, updated) '
+                             'VALUES (?, ?, ?, ?) ON CONFLICT (source) DO UPDATE SET position = excluded.position, '
+                             'imported = imported + excluded.imported, updated = excluded.updated',
+                             (source, position, len(new_rows), now_string()))
+            conn.commit()
+        self.remember(new_rows)
+        return len(new_rows), len(rows) - rejected - len(new_rows), rejected
+
+    def import_position(self, source):
+        """How many records of a source earlier imports have committed"""
+        with self.connection() as conn:
+            row = conn.execute('SELECT position FROM leaderboard_imports WHERE source = ?', (source,)).fetchone()
+        return row[0] if row else 0
+
+    def export_rows(self, after_id=0, chunk_size=10000):
+        """Yield every row with an id above after_id in id order, reading chunk_size rows at a time"""
+        with self.connection() as conn:
+            cursor = conn.execute('SELECT id, name, score, date FROM leaderboard WHERE id > ? ORDER BY id',
+                                  (after_id,))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(row)
+
+    def close(self):
+        """Close every idle pooled connection"""
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_stores = {}
+_stores_lock = Lock()
+
+
+def shared_store(db_path):
+    """The process-wide LeaderboardStore for a database file, opened on first use"""
+    key = os.path.abspath(db_path)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = LeaderboardStore(db_path)
+        return _stores[key]
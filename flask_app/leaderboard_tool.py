@@ -0,0 +1,133 @@
+"""Bulk import and export for the leaderboard database.
+
+Streams JSON Lines or CSV in chunks, so files of any size run in constant
+memory. Each chunk is written with one executemany in one transaction along
+with how far through the file it got; rerunning an interrupted import resumes
+from there, and rows already on the board are skipped either way:
+
+    python leaderboard_tool.py export scores.jsonl
+    python leaderboard_tool.py import scores.jsonl --db /srv/leaderboard.db
+    python leaderboard_tool.py export scores.csv --after-id 500000
+
+Run imports against a stopped server, or restart it afterwards: its cached
+boards only see scores written through itself.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from itertools import islice
+
+from leaderboard_store import LeaderboardStore
+
+CHUNK_SIZE = 10000
+CACHE_KIB = 262144  # Page cache for the tool's connection; index inserts for millions of rows stay in memory
+FIELDS = ('id', 'name', 'score', 'date')
+
+
+def file_format(path, requested):
+    if requested:
+        return requested
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_records(f, fmt):
+    """Records from an open file, one at a time"""
+    if fmt == 'csv':
+        yield from csv.DictReader(f)
+        return
+    for line in f:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield {}  # Counted as rejected, like any other invalid record
+
+
+def run_import(store, args):
+    source = os.path.abspath(args.path)
+    position = 0 if args.restart else store.import_position(source)
+    imported = duplicates = rejected = 0
+    started = time.perf_counter()
+
+    with open(args.path, newline='', encoding='utf-8') as f:
+        records = read_records(f, file_format(args.path, args.format))
+        if position:
+            print(f"Resuming after record {position}", file=sys.stderr)
+            for _ in islice(records, position):
+                pass
+
+        while True:
+            chunk = list(islice(records, args.chunk_size))
+            if not chunk:
+                break
+            position += len(chunk)
+            counts = store.import_rows(chunk, source, position)
+            imported += counts[0]
+            duplicates += counts[1]
+            rejected += counts[2]
+            elapsed = time.perf_counter() - started
+            print(f"{position} records, {imported} imported, {duplicates} duplicates, {rejected} rejected, "
+                  f"{position / elapsed:.0f} records/s", file=sys.stderr)
+
+    return {'records': position, 'imported': imported, 'duplicates': duplicates, 'rejected': rejected}
+
+
+def run_export(store, args):
+    fmt = file_format(args.path, args.format)
+    exported = 0
+    started = time.perf_counter()
+
+    f = sys.stdout if args.path == '-' else open(args.path, 'w', newline='', encoding='utf-8')
+    try:
+        writer = None
+        if fmt == 'csv':
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+        for row in store.export_rows(args.after_id, args.chunk_size):
+            if writer:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(row) + '\n')
+            exported += 1
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"{exported} rows exported, {exported / elapsed if elapsed else 0:.0f} rows/s", file=sys.stderr)
+    return {'exported': exported}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import and export leaderboard scores')
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('path', help="JSON Lines or CSV file; '-' exports to stdout")
+    parser.add_argument('--db', default='leaderboard.db', help='leaderboard database file')
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+                        help='file format; by default .csv files are CSV and anything else JSON Lines')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='records per transaction')
+    parser.add_argument('--restart', action='store_true',
+                        help='import from the start of the file even if an earlier run got further')
+    parser.add_argument('--after-id', type=int, default=0, help='export only rows with a higher id')
+    args = parser.parse_args()
+
+    store = LeaderboardStore(args.db)
+    # The tool is single threaded, so every call reuses this one pooled connection
+    with store.connection() as conn:
+        conn.execute(f'PRAGMA cache_size=-{CACHE_KIB}')
+    try:
+        if args.command == 'import':
+            result = run_import(store, args)
+        else:
+            result = run_export(store, args)
+    finally:
+        store.close()
+    print(json.dumps(result), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""Load test for the Socket.IO game server.
+
+Starts the server locally, connects waves of simulated players and reports
+action-to-frame latency, received frame rate and server CPU and memory for
+each concurrency step:
+
+    python loadtest.py --steps 50,100,250,500 --duration 20
+    python loadtest.py --server async --steps 100,500,1000
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+
+import socketio
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+# Launches the Flask app without the debug reloader so only one server process is measured
+FLASK_BOOTSTRAP = (
+    "import os; from app import create_app, socketio; "
+    "socketio.run(create_app(), host='127.0.0.1', port=int(os.environ['PORT']), allow_unsafe_werkzeug=True)"
+)
+
+JUMP_INTERVAL = (0.25, 0.6)  # seconds between jumps, like a player keeping the bird up
+FIRE_CHANCE = 0.1  # Chance that a jump is followed by a fireball
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, p):
+    """Nearest-rank percentile, or None for no samples"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def process_tree(pid):
+    """The pid and every descendant, so shard workers are counted too"""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    parents.setdefault(int(f.read().rsplit(')', 1)[1].split()[1]), []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    tree = [pid]
+    for parent in tree:
+        tree.extend(parents.get(parent, []))
+    return tree
+
+
+def process_usage(pid):
+    """Total (cpu seconds, rss bytes) for a process tree"""
+    cpu = 0.0
+    rss = 0
+    for child in process_tree(pid):
+        try:
+            with open(f'/proc/{child}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{child}/statm') as f:
+                rss += int(f.read().split()[1]) * PAGE_SIZE
+            cpu += (int(fields[11]) + int(fields[12])) / CLK_TCK
+        except (OSError, IndexError, ValueError):
+            pass
+    return cpu, rss
+
+
+class SimulatedPlayer:
+    """One Socket.IO client sending a realistic game_action stream"""
+
+    def __init__(self, url, encoding):
+        self.url = url
+        self.encoding = encoding
+        self.client = socketio.AsyncClient(reconnection=False)
+        self.client.on('game_update', self.on_game_update)
+        self.pending_actions = []  # Send times of actions not yet followed by a frame
+        self.latencies = []
+        self.frames = 0
+        self.recording = False
+        self.restarting = False  # A start is on its way for the game shown as over
+        self.task = None
+
+    async def on_game_update(self, data):
+        now = time.perf_counter()
+        if self.recording:
+            self.frames += 1
+            # Inputs are folded into the next frame, so that frame is the one that shows them
+            self.latencies.extend(now - sent for sent in self.pending_actions)
+        self.pending_actions = []
+
+        await self.client.emit('frame_ack', {'seq': data.get('seq')})
+        # Restart after a crash so every player keeps loading the server with a live game
+        if data.get('game_state') == 'OVER':
+            if not self.restarting:
+                self.restarting = True
+                await self.action('start')
+        else:
+            self.restarting = False
+
+    async def connect(self):
+        await self.client.connect(self.url, transports=['websocket'])
+        await self.action('init', encoding=self.encoding)
+        await self.action('start')
+        self.task = asyncio.create_task(self.play())
+
+    async def action(self, action, **data):
+        data['action'] = action
+        self.pending_actions.append(time.perf_counter())
+        await self.client.emit('game_action', data)
+
+    async def play(self):
+        while True:
+            await asyncio.sleep(random.uniform(*JUMP_INTERVAL))
+            await self.action('jump')
+            if random.random() < FIRE_CHANCE:
+                await self.action('fire')
+
+    async def disconnect(self):
+        if self.task:
+            self.task.cancel()
+        await self.client.disconnect()
+
+
+async def run_step(url, players, args):
+    """Connect a wave of players, measure for the step duration and disconnect them"""
+    clients = [SimulatedPlayer(url, args.encoding) for _ in range(players)]
+    connect_errors = 0
+    for start in range(0, players, args.connect_batch):
+        batch = clients[start:start + args.connect_batch]
+        results = await asyncio.gather(*(c.connect() for c in batch), return_exceptions=True)
+        connect_errors += sum(isinstance(r, Exception) for r in results)
+        await asyncio.sleep(args.connect_batch / args.connect_rate)
+
+    await asyncio.sleep(args.warmup)
+    cpu_start, _ = process_usage(args.server_pid)
+    started = time.perf_counter()
+    for c in clients:
+        c.recording = True
+
+    rss_max = 0
+    while time.perf_counter() - started < args.duration:
+        await asyncio.sleep(1.0)
+        rss_max = max(rss_max, process_usage(args.server_pid)[1])
+
+    elapsed = time.perf_counter() - started
+    for c in clients:
+        c.recording = False
+    cpu_end, _ = process_usage(args.server_pid)
+
+    await asyncio.gather(*(c.disconnect() for c in clients), return_exceptions=True)
+
+    latencies_ms = [latency * 1000 for c in clients for latency in c.latencies]
+    fps = [c.frames / elapsed for c in clients]
+    return {
+        'players': players,
+        'connect_errors': connect_errors,
+        'latency_ms': {f'p{p}': percentile(latencies_ms, p) for p in PERCENTILES},
+        # Frame rate tails are the slow clients: p99 is the rate 99% of clients received at least
+        'fps': {f'p{p}': percentile(fps, 100 - p) for p in PERCENTILES},
+        'server_cpu_percent': (cpu_end - cpu_start) / elapsed * 100,
+        'server_rss_mb': rss_max / (1024 * 1024)
+    }
+
+
+def start_server(args):
+    env = dict(os.environ, PORT=str(args.port))
+    if args.server == 'async':
+        command = [sys.executable, 'async_server.py']
+    else:
+        env['GAME_SERVER_MODE'] = args.server
+        command = [sys.executable, '-c', FLASK_BOOTSTRAP]
+    process = subprocess.Popen(command, cwd=BASE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Server exited with code {process.returncode}")
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{args.port}/', timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.5)
+    process.kill()
+    raise SystemExit("Server did not start within 60 seconds")
+
+
+def format_value(value, digits=1):
+    return '-' if value is None else f'{value:.{digits}f}'
+
+
+def print_header():
+    columns = ['players', 'errors'] + [f'lat {p}' for p in ('p50', 'p95', 'p99')] + \
+        [f'fps {p}' for p in ('p50', 'p95', 'p99')] + ['cpu %', 'rss MB']
+    print(' '.join(f'{column:>8}' for column in columns))
+
+
+def print_row(result):
+    values = [str(result['players']), str(result['connect_errors'])]
+    values += [format_value(v) for v in result['latency_ms'].values()]
+    values += [format_value(v) for v in result['fps'].values()]
+    values += [format_value(result['server_cpu_percent'], 0), format_value(result['server_rss_mb'], 0)]
+    print(' '.join(f'{value:>8}' for value in values), flush=True)
+
+
+async def run(args):
+    url = f'http://127.0.0.1:{args.port}'
+    results = []
+    print_header()
+    for players in args.steps:
+        result = await run_step(url, players, args)
+        results.append(result)
+        print_row(result)
+        await asyncio.sleep(args.cooldown)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the Socket.IO game server')
+    parser.add_argument('--server', choices=['threaded', 'sharded', 'async'], default='threaded')
+    parser.add_argument('--port', type=int, default=5100)
+    parser.add_argument('--steps', default='10,50,100,250',
+                        help='comma separated player counts, one step each')
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds per step')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds before measuring a step')
+    parser.add_argument('--cooldown', type=float, default=3, help='seconds between steps')
+    parser.add_argument('--connect-rate', type=float, default=200, help='connects per second')
+    parser.add_argument('--connect-batch', type=int, default=20)
+    parser.add_argument('--encoding', choices=['png', 'jpeg', 'tiles'], default='png')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+    args.steps = [int(step) for step in args.steps.split(',')]
+
+    server = start_server(args)
+    args.server_pid = server.pid
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'server': args.server, 'encoding': args.encoding, 'steps': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
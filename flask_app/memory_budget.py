@@ -0,0 +1,48 @@
+import os
+import sys
+from collections import deque
+
+import pygame
+
+MEMORY_BUDGET_KB = int(os.environ.get('GAME_MEMORY_BUDGET_KB', 512))  # Per game instance
+DEFAULT_PARTICLE_CAP = 200  # Per particle list, before any degrading
+MIN_PARTICLE_CAP = 0
+
+
+def surface_bytes(surface):
+    """Pixel memory held by a surface"""
+    return surface.get_height() * surface.get_pitch()
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate memory held by an object and everything it references"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, pygame.Surface):
+        return sys.getsizeof(obj) + surface_bytes(obj)
+    if isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return sys.getsizeof(obj)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        for item in obj:
+            size += deep_sizeof(item, seen)
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def process_rss_bytes():
+    """Resident set size of this process, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
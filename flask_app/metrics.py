@@ -0,0 +1,179 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+
+# Upper bounds in seconds; 0.0167 is one tick at 60 FPS
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.0167, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Metric:
+    """A named metric with optional labels, rendered in Prometheus text format"""
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=(), registry=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values tuple -> value
+        self.lock = Lock()
+        (registry or REGISTRY).register(self)
+
+    def snapshot(self):
+        """Copy of the current values, safe to pickle to another process"""
+        with self.lock:
+            return {labels: self._copy(value) for labels, value in self.values.items()}
+
+    def _copy(self, value):
+        return value
+
+    def samples(self, values):
+        """(suffix, labels, value) lines for the given values"""
+        for labels, value in sorted(values.items()):
+            yield '', self._label_pairs(labels), value
+
+    def _label_pairs(self, labels):
+        return list(zip(self.labelnames, labels))
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, labels=()):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, labels=()):
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help_text, labelnames, registry)
+
+    def observe(self, value, labels=()):
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                # One count per bucket, one for +Inf, then the running sum
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, labels=()):
+        """Observe how long the with-block took"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, labels)
+
+    def _copy(self, value):
+        return list(value)
+
+    def samples(self, values):
+        bounds = [repr(b) for b in self.buckets] + ['+Inf']
+        for labels, counts in sorted(values.items()):
+            pairs = self._label_pairs(labels)
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield '_bucket', pairs + [('le', bound)], cumulative
+            yield '_sum', pairs, counts[-1]
+            yield '_count', pairs, cumulative
+
+
+class Registry:
+    """Every metric in this process, plus the latest snapshots reported by other processes"""
+
+    def __init__(self):
+        self.metrics = []
+        self.remote = {}  # source -> {metric name: snapshot}
+        self.lock = Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+
+    def snapshot(self):
+        """Values of every metric, for shipping to the process that serves /metrics"""
+        with self.lock:
+            metrics = list(self.metrics)
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def merge_remote(self, source, snapshot):
+        """Replace the values last reported by a worker process; they are cumulative"""
+        with self.lock:
+            self.remote[source] = snapshot
+
+    def render(self):
+        """Prometheus text exposition of local and remote values added together"""
+        with self.lock:
+            metrics = list(self.metrics)
+            remote = list(self.remote.values())
+
+        lines = []
+        for metric in metrics:
+            values = metric.snapshot()
+            for snapshot in remote:
+                for labels, value in snapshot.get(metric.name, {}).items():
+                    values[labels] = _add(values.get(labels), value)
+
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for suffix, pairs, value in metric.samples(values):
+                label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in pairs)
+                label_text = '{' + label_text + '}' if label_text else ''
+                lines.append(f'{metric.name}{suffix}{label_text} {_format(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _add(a, b):
+    if a is None:
+        return list(b) if isinstance(b, list) else b
+    if isinstance(a, list):
+        return [x + y for x, y in zip(a, b)]
+    return a + b
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+
+ACTIVE_GAMES = Gauge('game_server_active_games', 'Game instances currently being ticked')
+QUEUED_SESSIONS = Gauge('game_server_queued_sessions', 'Sessions waiting for admission')
+SPECTATORS = Gauge('game_server_spectators', "Clients watching another player's game")
+CONNECTS = Counter('game_server_connects_total', 'Socket.IO client connects')
+DISCONNECTS = Counter('game_server_disconnects_total', 'Socket.IO client disconnects')
+TICK_SECONDS = Histogram('game_server_tick_seconds', 'Time to update every game for one tick')
+TICK_LAG_SECONDS = Histogram('game_server_tick_lag_seconds', 'How late each tick started')
+RENDER_SECONDS = Histogram('game_server_render_seconds', 'Time to draw one frame')
+ENCODE_SECONDS = Histogram('game_server_encode_seconds', 'Time to encode one drawn frame', ('format',))
+EMITTED_BYTES = Counter('game_server_emitted_bytes_total',
+                        'Frame payload bytes sent to clients; rate() gives bytes per second')
+SQLITE_QUERY_SECONDS = Histogram('leaderboard_query_seconds', 'SQLite leaderboard query latency', ('query',))
+SCORE_QUEUE_DEPTH = Gauge('leaderboard_write_queue_depth', 'Score submissions waiting for a group commit')
+SCORE_COMMIT_SECONDS = Histogram('leaderboard_commit_seconds', 'Time to insert and commit one batch of scores')
+SCORE_BATCH_SIZE = Histogram('leaderboard_commit_batch_size', 'Scores written per group commit',
+                             buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500))
+SCORE_ACK_SECONDS = Histogram('leaderboard_ack_seconds', 'Time from score submission to durable commit')
+REPLAY_QUEUE_DEPTH = Gauge('replay_queue_depth', 'Replay-attached scores waiting for or in verification')
+REPLAY_VERIFY_SECONDS = Histogram('replay_verify_cpu_seconds', 'Worker CPU time to re-simulate one replay',
+                                  buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+REPLAY_RESULTS = Counter('replay_results_total', 'Verified score submissions by outcome', ('result',))
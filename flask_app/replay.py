@@ -0,0 +1,336 @@
+"""Server-side verification of scores from the browser game (static/js/game.js).
+
+A run is fully described by the seed of its random generator and the inputs the
+player made, each tagged with the frame counter it arrived at. simulate() steps
+the same rules as game.js with the same generator, headless and as fast as it
+can, and returns the score the run really reaches. All the arithmetic is on
+doubles and 32-bit integers, so both sides agree to the last bit.
+"""
+import os
+import math
+import time
+import queue
+import secrets
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+
+from leaderboard_store import validate_name, validate_score
+from metrics import REPLAY_QUEUE_DEPTH, REPLAY_VERIFY_SECONDS, REPLAY_RESULTS
+
+REPLAY_WORKERS = int(os.environ.get('REPLAY_WORKERS', os.cpu_count() or 1))
+REPLAY_QUEUE_SIZE = int(os.environ.get('REPLAY_QUEUE_SIZE', 1000))  # Replays waiting or running beyond this are refused
+MAX_REPLAY_FRAMES = int(os.environ.get('REPLAY_MAX_FRAMES', 60 * 60 * 60))  # An hour at 60 frames per second
+MAX_REPLAY_INPUTS = MAX_REPLAY_FRAMES // 4
+TICKETS_KEPT = 10000  # Finished results kept for clients to poll, oldest dropped first
+SEEDS_KEPT = int(os.environ.get('REPLAY_SEEDS_KEPT', 100000))  # Issued seeds not yet used, oldest dropped first
+
+# The browser game's rules; these must match static/js/game.js
+CANVAS_WIDTH = 400
+CANVAS_HEIGHT = 600
+GRAVITY = 0.5
+JUMP_FORCE = -10
+PIPE_WIDTH = 80
+PIPE_GAP = 200
+PIPE_SPEED = 3
+PIPE_INTERVAL = 100  # frames
+BIRD_WIDTH = 40
+BIRD_HEIGHT = 30
+FIREBALL_SPEED = 7
+FIREBALL_SIZE = 15
+ENEMY_SIZE = 40
+ENEMY_SPEED = 2
+ENEMY_INTERVAL = 200  # frames
+ACTIONS = ('jump', 'fire')
+
+MASK_32 = 0xFFFFFFFF
+
+
+def mulberry32(seed):
+    """The seeded generator game.js uses, returning floats in [0, 1) like Math.random"""
+    state = seed & MASK_32
+
+    def random():
+        nonlocal state
+        state = (state + 0x6D2B79F5) & MASK_32
+        t = ((state ^ (state >> 15)) * (state | 1)) & MASK_32
+        t ^= (t + ((t ^ (t >> 7)) * (t | 61))) & MASK_32
+        return ((t ^ (t >> 14)) & MASK_32) / 4294967296
+
+    return random
+
+
+def parse_replay(replay):
+    """(seed, [(frame, action), ...]) from a submitted replay, raising ValueError if it is malformed"""
+    if not isinstance(replay, dict):
+        raise ValueError('replay must be an object with seed and inputs')
+    seed = replay.get('seed')
+    inputs = replay.get('inputs')
+    if not isinstance(seed, int) or isinstance(seed, bool) or not 0 <= seed <= MASK_32:
+        raise ValueError('replay seed must be a 32-bit unsigned integer')
+    if not isinstance(inputs, list) or len(inputs) > MAX_REPLAY_INPUTS:
+        raise ValueError(f'replay inputs must be a list of at most {MAX_REPLAY_INPUTS} [frame, action] pairs')
+
+    parsed = []
+    last_frame = 0
+    for entry in inputs:
+        if not isinstance(entry, list) or len(entry) != 2:
+            raise ValueError('replay inputs must be [frame, action] pairs')
+        frame, action = entry
+        if not isinstance(frame, int) or isinstance(frame, bool) or not last_frame <= frame <= MAX_REPLAY_FRAMES:
+            raise ValueError('replay input frames must be in order')
+        if action not in ACTIONS:
+            raise ValueError(f"replay actions must be one of {', '.join(ACTIONS)}")
+        parsed.append((frame, action))
+        last_frame = frame
+    return seed, parsed
+
+
+def simulate(seed, inputs, max_frames=MAX_REPLAY_FRAMES):
+    """(score, frames) a run reaches, following update() in game.js step for step.
+
+    Inputs are applied before the update that follows the frame they are tagged
+    with, as they are in the browser. Raises ValueError if the run is still going
+    after max_frames.
+    """
+    random = mulberry32(seed)
+    bird_x = CANVAS_WIDTH / 4
+    bird_y = CANVAS_HEIGHT / 2
+    velocity = 0
+    pipes = []  # [x, y, height, passed]
+    fireballs = []  # [x, y]
+    enemies = []  # [x, y]
+    score = 0
+    frames = 0
+    next_input = 0
+
+    while frames < max_frames:
+        while next_input < len(inputs) and inputs[next_input][0] == frames:
+            if inputs[next_input][1] == 'jump':
+                velocity = JUMP_FORCE
+            else:
+                fireballs.append([bird_x + BIRD_WIDTH, bird_y + BIRD_HEIGHT / 2])
+            next_input += 1
+
+        frames += 1
+        velocity += GRAVITY
+        bird_y += velocity
+        if bird_y + BIRD_HEIGHT >= CANVAS_HEIGHT or bird_y <= 0:
+            return score, frames
+
+        if frames % PIPE_INTERVAL == 0:
+            pipe_height = math.floor(random() * (CANVAS_HEIGHT - PIPE_GAP - 100)) + 50
+            pipes.append([CANVAS_WIDTH, 0, pipe_height, False])
+            pipes.append([CANVAS_WIDTH, pipe_height + PIPE_GAP, CANVAS_HEIGHT - pipe_height - PIPE_GAP, False])
+        if frames % ENEMY_INTERVAL == 0:
+            enemies.append([CANVAS_WIDTH, random() * (CANVAS_HEIGHT - ENEMY_SIZE)])
+
+        for i, pipe in enumerate(pipes):
+            pipe[0] -= PIPE_SPEED
+            if not pipe[3] and pipe[0] + PIPE_WIDTH < bird_x:
+                pipe[3] = True
+                if i % 2 == 0:  # Top and bottom pipes come in pairs; only the top one scores
+                    score += 1
+            if (bird_x + BIRD_WIDTH > pipe[0] and bird_x < pipe[0] + PIPE_WIDTH and
+                    bird_y + BIRD_HEIGHT > pipe[1] and bird_y < pipe[1] + pipe[2]):
+                return score, frames
+        pipes = [pipe for pipe in pipes if pipe[0] + PIPE_WIDTH > 0]
+
+        for fireball in fireballs:
+            fireball[0] += FIREBALL_SPEED
+        fireballs = [fireball for fireball in fireballs if fireball[0] < CANVAS_WIDTH]
+
+        i = 0
+        while i < len(enemies):
+            enemy = enemies[i]
+            enemy[0] -= ENEMY_SPEED
+            if (bird_x + BIRD_WIDTH > enemy[0] and bird_x < enemy[0] + ENEMY_SIZE and
+                    bird_y + BIRD_HEIGHT > enemy[1] and bird_y < enemy[1] + ENEMY_SIZE):
+                return score, frames
+            for j, fireball in enumerate(fireballs):
+                if (fireball[0] + FIREBALL_SIZE > enemy[0] and fireball[0] < enemy[0] + ENEMY_SIZE and
+                        fireball[1] + FIREBALL_SIZE > enemy[1] and fireball[1] < enemy[1] + ENEMY_SIZE):
+                    del enemies[i]
+                    del fireballs[j]
+                    score += 2
+                    i -= 1
+                    break
+            i += 1
+        enemies = [enemy for enemy in enemies if enemy[0] + ENEMY_SIZE > 0]
+
+    raise ValueError(f'Replay is still running after {max_frames} frames')
+
+
+def replay_score(seed, inputs):
+    """Runs in a worker process: (score or None if the replay never ends, frames, CPU seconds)"""
+    started = time.process_time()
+    try:
+        score, frames = simulate(seed, inputs)
+    except ValueError:
+        score, frames = None, MAX_REPLAY_FRAMES
+    return score, frames, time.process_time() - started
+
+
+class ReplayVerifier:
+    """Replays submitted runs in a pool of worker processes and inserts the scores that hold up.
+
+    Runs are seeded with issue_seed(), and each seed backs one submitted replay,
+    so the same run can't be submitted twice. submit() only queues the run and
+    returns a ticket; status() reports it as 'verifying' until a worker has
+    replayed it, then 'accepted' with the row id and rank, or 'rejected'.
+    """
+
+    def __init__(self, store, workers=REPLAY_WORKERS, max_pending=REPLAY_QUEUE_SIZE):
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor = None
+        self.lock = Lock()
+        self.pending = 0
+        self.tickets = OrderedDict()  # ticket -> status dict
+        self.seeds = OrderedDict()  # Issued seeds not yet used, oldest first
+        self.results = {'accepted': 0, 'rejected': 0, 'failed': 0}
+        self.frames = 0
+        self.cpu_seconds = 0.0
+
+    def start(self):
+        """Start the worker processes if they are not already running"""
+        with self.lock:
+            if self.executor is None:
+                self.executor = self._new_executor()
+
+    def _new_executor(self):
+        # Spawned like the game shards, so workers don't inherit the server's threads and sockets
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def issue_seed(self):
+        """A fresh seed for one run, good for a single submitted replay"""
+        with self.lock:
+            seed = secrets.randbits(32)
+            while seed in self.seeds:
+                seed = secrets.randbits(32)
+            self.seeds[seed] = None
+            while len(self.seeds) > SEEDS_KEPT:
+                self.seeds.popitem(last=False)
+            return seed
+
+    def submit(self, name, score, replay):
+        """Queue a replay-attached score for verification, returning its ticket.
+
+        Raises ValueError for an invalid name, score or malformed replay, or a seed
+        that was not issued or is already used, queue.Full when too many replays
+        are already waiting, and RuntimeError when the worker pool can't take it.
+        """
+        validate_name(name)
+        validate_score(score)
+        seed, inputs = parse_replay(replay)
+        self.start()
+        ticket = secrets.token_urlsafe(12)
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise queue.Full
+            if seed not in self.seeds:
+                raise ValueError('replay seed was not issued by this server or has already been used')
+            del self.seeds[seed]
+            self.pending += 1
+            REPLAY_QUEUE_DEPTH.set(self.pending)
+            self._set_status(ticket, {'status': 'verifying'})
+        try:
+            future = self._submit_replay(seed, inputs)
+        except RuntimeError:
+            # Nothing was queued, so the run can be submitted again
+            with self.lock:
+                self.pending -= 1
+                REPLAY_QUEUE_DEPTH.set(self.pending)
+                self.tickets.pop(ticket, None)
+                self.seeds[seed] = None
+            raise
+        future.add_done_callback(lambda done: self._replayed(ticket, name, score, seed, done))
+        return ticket
+
+    def status(self, ticket):
+        """The status dict of a ticket, or None if it is unknown or long finished"""
+        with self.lock:
+            status = self.tickets.get(ticket)
+            return dict(status) if status is not None else None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'queued': self.pending,
+                **self.results,
+                # Throughput of one core, from the CPU time the workers spent replaying
+                'frames_per_core_second': self.frames / self.cpu_seconds if self.cpu_seconds else 0.0,
+                'replays_per_core_second': (self.results['accepted'] + self.results['rejected']) / self.cpu_seconds
+                                           if self.cpu_seconds else 0.0
+            }
+
+    def _submit_replay(self, seed, inputs):
+        """Hand a replay to the pool, replacing the pool once if a dead worker broke it"""
+        executor = self.executor
+        try:
+            return executor.submit(replay_score, seed, inputs)
+        except BrokenProcessPool as e:
+            print(f"Replay pool is broken, starting a new one: {e}")
+        with self.lock:
+            if self.executor is executor:  # Unless another submission already replaced it
+                self.executor = self._new_executor()
+            replacement = self.executor
+        executor.shutdown(wait=False, cancel_futures=True)
+        return replacement.submit(replay_score, seed, inputs)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _set_status(self, ticket, status):
+        # Called with the lock held
+        self.tickets[ticket] = status
+        self.tickets.move_to_end(ticket)
+        while len(self.tickets) > TICKETS_KEPT:
+            self.tickets.popitem(last=False)
+
+    def _replayed(self, ticket, name, score, seed, done):
+        # Runs on the executor's result thread, so it only queues the insert and never waits on it
+        try:
+            replayed, frames, cpu_seconds = done.result()
+        except Exception as e:
+            print(f"Error verifying replay: {e}")
+            self._finish(ticket, 'failed', {'error': 'Verification failed, try again'}, seed)
+            return
+        REPLAY_VERIFY_SECONDS.observe(cpu_seconds)
+        with self.lock:
+            self.frames += frames
+            self.cpu_seconds += cpu_seconds
+
+        if replayed != score:
+            self._finish(ticket, 'rejected', {'error': 'Score does not match the replay'})
+            return
+        try:
+            committing = self.store.submit_score(name, score)
+        except queue.Full:
+            self._finish(ticket, 'failed', {'error': 'Too many score submissions, try again shortly'}, seed)
+            return
+        committing.add_done_callback(lambda committed: self._committed(ticket, score, seed, committed))
+
+    def _committed(self, ticket, score, seed, committed):
+        try:
+            row_id = committed.result()
+        except Exception:
+            self._finish(ticket, 'failed', {'error': 'Could not save the score'}, seed)
+            return
+        self._finish(ticket, 'accepted', {'id': row_id, 'rank': self.store.rank(score)})
+
+    def _finish(self, ticket, result, details, seed=None):
+        # A run that failed without being judged gives its seed back, so it can be submitted again
+        REPLAY_RESULTS.inc(labels=(result,))
+        with self.lock:
+            if seed is not None:
+                self.seeds[seed] = None
+            self.pending -= 1
+            REPLAY_QUEUE_DEPTH.set(self.pending)
+            self.results[result] += 1
+            self._set_status(ticket, {'status': result, **details})
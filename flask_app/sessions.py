@@ -0,0 +1,116 @@
+import os
+import time
+import secrets
+from threading import Thread, Lock
+
+SESSION_GRACE_SECONDS = float(os.environ.get('GAME_SESSION_GRACE', 30))  # Disconnected sessions kept this long
+SWEEP_INTERVAL = 1.0  # seconds
+
+
+class Session:
+    """A player's game, which outlives any one connection"""
+
+    def __init__(self):
+        self.token = secrets.token_urlsafe(24)  # Secret, only ever sent to the owning client
+        self.game_id = secrets.token_urlsafe(12)  # Public, used for spectating
+        self.sid = None
+        self.disconnected_at = None
+        self.encoding = 'png'  # Codec the client asked for in 'init', kept for when it resumes
+
+
+class SessionManager:
+    """Resumable sessions keyed by token, with disconnected ones expired by a background sweeper"""
+
+    def __init__(self, on_expire, grace_period=SESSION_GRACE_SECONDS):
+        self.on_expire = on_expire  # Called with the game id of every expired session
+        self.grace_period = grace_period
+        self.by_token = {}
+        self.by_sid = {}
+        self.by_game = {}
+        self.lock = Lock()
+        self.sweep_thread = None
+
+    def start(self):
+        """Start the background sweeper if it is not already running"""
+        with self.lock:
+            if self.sweep_thread is None:
+                self.sweep_thread = Thread(target=self._sweep_loop)
+                self.sweep_thread.daemon = True
+                self.sweep_thread.start()
+
+    def connect(self, sid, token=None):
+        """Attach a connection to the session for its token, or to a new one.
+
+        A token takes its session over even while another connection holds it,
+        since after a network blip the server keeps the dead socket until its
+        ping timeout. Returns the session, whether it was resumed, and the sid
+        it was taken from or None.
+        """
+        self.start()
+        with self.lock:
+            session = self.by_token.get(token) if token else None
+            resumed = session is not None
+            stale_sid = None
+            if not resumed:
+                session = Session()
+                self.by_token[session.token] = session
+                self.by_game[session.game_id] = session
+            elif session.sid is not None:
+                stale_sid = session.sid
+                self.by_sid.pop(stale_sid, None)
+            session.sid = sid
+            session.disconnected_at = None
+            self.by_sid[sid] = session
+            return session, resumed, stale_sid
+
+    def disconnect(self, sid):
+        """Detach a connection, starting its session's grace period"""
+        with self.lock:
+            session = self.by_sid.pop(sid, None)
+            if session is not None:
+                session.sid = None
+                session.disconnected_at = time.monotonic()
+            return session
+
+    def discard(self, sid):
+        """End a connection's session at once, returning it"""
+        with self.lock:
+            session = self.by_sid.pop(sid, None)
+            if session is not None:
+                self.by_token.pop(session.token, None)
+                self.by_game.pop(session.game_id, None)
+            return session
+
+    def for_sid(self, sid):
+        with self.lock:
+            return self.by_sid.get(sid)
+
+    def for_game(self, game_id):
+        with self.lock:
+            return self.by_game.get(game_id)
+
+    def stats(self):
+        """Connected and paused session counts"""
+        with self.lock:
+            connected = len(self.by_sid)
+            return {'connected': connected, 'paused': len(self.by_token) - connected}
+
+    def sweep(self):
+        """Expire sessions whose grace period has run out"""
+        cutoff = time.monotonic() - self.grace_period
+        with self.lock:
+            expired = [s for s in self.by_token.values()
+                       if s.disconnected_at is not None and s.disconnected_at < cutoff]
+            for session in expired:
+                del self.by_token[session.token]
+                self.by_game.pop(session.game_id, None)
+        for session in expired:
+            self.on_expire(session.game_id)
+
+    def _sweep_loop(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error sweeping sessions: {e}")
+            time.sleep(SWEEP_INTERVAL)
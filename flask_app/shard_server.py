@@ -0,0 +1,289 @@
+import os
+import queue
+import time
+import zlib
+import multiprocessing
+from collections import deque
+from threading import Thread, Lock
+
+from admission import AdmissionController, ADMIT_STEP, MAX_ACTIVE
+from metrics import REGISTRY
+
+SHARD_COUNT = int(os.environ.get('GAME_SHARDS', os.cpu_count() or 1))
+METRICS_INTERVAL = 1.0  # seconds between shard metric reports
+
+
+def shard_for(user_id, shard_count):
+    """Pick a shard for a session id, stable across processes"""
+    return zlib.crc32(user_id.encode('utf-8')) % shard_count
+
+
+def run_shard(shard_id, inbox, outbox):
+    """Worker process that owns a subset of game instances"""
+    # Imported here so pygame is only initialised inside the worker
+    from game_server import InstancePool, TickScheduler, FPS
+    from memory_budget import MEMORY_BUDGET_KB
+    from metrics import REGISTRY, TICK_SECONDS, TICK_LAG_SECONDS
+
+    games = {}
+    admission = AdmissionController()
+    pool = InstancePool()
+    pool.start()
+    memory_budget = MEMORY_BUDGET_KB * 1024  # Applied to every game this shard runs, including later ones
+    scheduler = TickScheduler(FPS)
+    tick_count = 0
+    tick_total = 0.0
+    tick_max = 0.0
+    lag_max = 0.0
+    last_report = time.perf_counter()
+
+    while True:
+        while True:
+            try:
+                kind, user_id, payload = inbox.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == 'stop':
+                return
+            if kind == 'budget':
+                memory_budget = payload['budget_kb'] * 1024
+                for game in games.values():
+                    game.memory_budget = memory_budget
+                continue
+            if kind == 'remove':
+                game = games.pop(user_id, None)
+                if game is not None:
+                    pool.release(game)
+                continue
+            if kind == 'spectators':
+                # Only running games can be watched, so unknown ids are ignored rather than created
+                game = games.get(user_id)
+                if game is not None and game.spectators + payload['delta'] >= 0:
+                    game.spectators += payload['delta']
+                    game.viewers = max(0, game.viewers + payload['delta'])
+                continue
+
+            if user_id not in games:
+                games[user_id] = pool.acquire(user_id)
+                games[user_id].memory_budget = memory_budget
+            game = games[user_id]
+            # 'admit' only needs the instance to exist
+
+            if kind == 'action':
+                game.queue_action(payload.get('action'), payload)
+            elif kind == 'viewers':
+                game.viewers = max(0, game.viewers + payload['delta'])
+
+        tick_start = time.perf_counter()
+        for user_id, game in games.items():
+            try:
+                game.shed_level = admission.level
+                game.update()
+                if game.frame_due():
+                    outbox.put(('update', user_id, game.get_state()))
+            except Exception as e:
+                print(f"Error updating game {user_id} on shard {shard_id}: {e}")
+        tick_time = time.perf_counter() - tick_start
+        TICK_SECONDS.observe(tick_time)
+        admission.record_tick(tick_time)
+
+        tick_count += 1
+        tick_total += tick_time
+        tick_max = max(tick_max, tick_time)
+
+        lag = scheduler.wait()
+        TICK_LAG_SECONDS.observe(lag)
+        lag_max = max(lag_max, lag)
+
+        if tick_start - last_report >= METRICS_INTERVAL:
+            admission.evaluate(len(games))
+            outbox.put(('metrics', shard_id, {
+                'games': len(games),
+                'ticks': tick_count,
+                'tick_ms_avg': tick_total / tick_count * 1000,
+                'tick_ms_max': tick_max * 1000,
+                'tick_lag_ms_max': lag_max * 1000,
+                'tick_budget_ms': scheduler.interval * 1000,
+                'input_latency_ms_max': max((g.input_latency_max for g in games.values()), default=0.0) * 1000,
+                'memory': {uid: game.memory_summary() for uid, game in games.items()},
+                'admission': admission.stats(),
+                # Cumulative histograms, merged into the front process's /metrics
+                'registry': REGISTRY.snapshot()
+            }))
+            tick_count = 0
+            tick_total = 0.0
+            tick_max = 0.0
+            lag_max = 0.0
+            last_report = tick_start
+
+
+class ShardedGameServer:
+    """Front-process handle for game instances spread across worker processes"""
+
+    def __init__(self, on_update, shard_count=SHARD_COUNT):
+        self.on_update = on_update
+        self.shard_count = shard_count
+        self.context = multiprocessing.get_context('spawn')
+        self.inboxes = []
+        self.processes = []
+        self.outbox = None
+        self.pump_thread = None
+        self.shard_metrics = {}
+        self.shard_memory = {}  # shard id -> per-session memory summaries from its latest report
+        self.lock = Lock()
+        
+        # Admission is decided here from each shard's reported capacity
+        self.active = [set() for _ in range(shard_count)]
+        self.waiting = [deque() for _ in range(shard_count)]
+        self.allowed = [min(MAX_ACTIVE, ADMIT_STEP)] * shard_count
+        self.on_admit = None  # Called with user_id when a queued session is let in
+        self.on_queue = None  # Called with (user_id, position) for every queued session on each shard report
+
+    def start(self):
+        """Start the shard processes if they are not already running"""
+        with self.lock:
+            if self.processes:
+                return
+            self.outbox = self.context.Queue()
+            for shard_id in range(self.shard_count):
+                inbox = self.context.Queue()
+                process = self.context.Process(target=run_shard, args=(shard_id, inbox, self.outbox))
+                process.daemon = True
+                process.start()
+                self.inboxes.append(inbox)
+                self.processes.append(process)
+            self.pump_thread = Thread(target=self._pump_outputs)
+            self.pump_thread.daemon = True
+            self.pump_thread.start()
+
+    def stop(self):
+        """Ask every shard to exit"""
+        with self.lock:
+            for inbox in self.inboxes:
+                inbox.put(('stop', None, None))
+            for process in self.processes:
+                process.join(timeout=5)
+            self.inboxes = []
+            self.processes = []
+
+    def _send(self, kind, user_id, payload):
+        self.start()
+        self.inboxes[shard_for(user_id, self.shard_count)].put((kind, user_id, payload))
+
+    def admit(self, user_id):
+        """Start a game for a new session if its shard has room, returning its queue position or 0"""
+        shard = shard_for(user_id, self.shard_count)
+        with self.lock:
+            if self.waiting[shard] or len(self.active[shard]) >= self.allowed[shard]:
+                self.waiting[shard].append(user_id)
+                return len(self.waiting[shard])
+            self.active[shard].add(user_id)
+        self._send('admit', user_id, None)
+        return 0
+    
+    def queue_position(self, user_id):
+        """A queued session's place in its shard's line, or 0 if it is not queued"""
+        shard = shard_for(user_id, self.shard_count)
+        with self.lock:
+            waiting = self.waiting[shard]
+            return waiting.index(user_id) + 1 if user_id in waiting else 0
+    
+    def leave_queue(self, user_id):
+        """Forget a queued session"""
+        shard = shard_for(user_id, self.shard_count)
+        with self.lock:
+            if user_id in self.waiting[shard]:
+                self.waiting[shard].remove(user_id)
+    
+    def _admit_waiting(self, shard):
+        """Let queued sessions onto a shard while it has room and tell the rest where they stand"""
+        with self.lock:
+            admitted = []
+            while self.waiting[shard] and len(self.active[shard]) < self.allowed[shard]:
+                user_id = self.waiting[shard].popleft()
+                self.active[shard].add(user_id)
+                admitted.append(user_id)
+            waiting = list(self.waiting[shard])
+        
+        for user_id in admitted:
+            self._send('admit', user_id, None)
+            if self.on_admit:
+                self.on_admit(user_id)
+        if self.on_queue:
+            for position, user_id in enumerate(waiting, 1):
+                self.on_queue(user_id, position)
+    
+    def add_viewer(self, user_id):
+        """Start broadcasting frames for a game on its shard"""
+        self._send('viewers', user_id, {'delta': 1})
+
+    def remove_viewer(self, user_id):
+        """Stop broadcasting frames for a game once nobody is watching"""
+        self._send('viewers', user_id, {'delta': -1})
+
+    def add_spectator(self, user_id):
+        """Broadcast a game to one more spectator; the shard ignores games it is not running"""
+        self._send('spectators', user_id, {'delta': 1})
+        return True
+
+    def remove_spectator(self, user_id):
+        """Drop a spectator from a game"""
+        self._send('spectators', user_id, {'delta': -1})
+
+    def submit_action(self, user_id, action, data):
+        """Forward a game_action to the shard that owns the session"""
+        payload = dict(data)
+        payload['action'] = action
+        self._send('action', user_id, payload)
+
+    def remove_game(self, user_id):
+        """Remove a game instance from its shard"""
+        with self.lock:
+            self.active[shard_for(user_id, self.shard_count)].discard(user_id)
+        if self.processes:
+            self._send('remove', user_id, None)
+
+    def _pump_outputs(self):
+        """Deliver shard output to the front process"""
+        while True:
+            kind, key, payload = self.outbox.get()
+            if kind == 'update':
+                self.on_update(key, payload)
+            elif kind == 'metrics':
+                REGISTRY.merge_remote(('shard', key), payload.pop('registry', {}))
+                self.shard_memory[key] = payload.pop('memory', {})
+                self.shard_metrics[key] = payload
+                self.allowed[key] = payload['admission']['allowed']
+                try:
+                    self._admit_waiting(key)
+                except Exception as e:
+                    print(f"Error admitting queued sessions to shard {key}: {e}")
+
+    def set_memory_budget(self, budget_kb):
+        """Change the per-instance memory budget on every shard"""
+        self.start()
+        for inbox in self.inboxes:
+            inbox.put(('budget', None, {'budget_kb': budget_kb}))
+
+    def memory_report(self):
+        """Latest per-session memory breakdown across all shards, refreshed with each shard report"""
+        report = {}
+        for sessions in list(self.shard_memory.values()):
+            report.update(sessions)
+        return report
+
+    def get_metrics(self):
+        """Per-shard tick metrics plus a players-per-core estimate"""
+        shards = dict(self.shard_metrics)
+        games = sum(m['games'] for m in shards.values())
+        busy = sum(m['tick_ms_avg'] / m['tick_budget_ms'] for m in shards.values())
+        with self.lock:
+            queued = sum(len(waiting) for waiting in self.waiting)
+        return {
+            'shards': shards,
+            'games': games,
+            'queued': queued,
+            # Players one core could tick at the current per-game cost
+            'players_per_core': games / busy if busy else None
+        }
@@ -1,66 +1,29 @@
 import os
 import json
-import sqlite3
-from datetime import datetime
+import queue
 from flask import Flask, render_template, request, jsonify, session
 
+from leaderboard_store import shared_store
+
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
 DB_PATH = 'leaderboard.db'
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS leaderboard (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        score INTEGER NOT NULL,
-        date TEXT NOT NULL
-    )
-    ''')
-    conn.commit()
-    conn.close()
+leaderboard = shared_store(DB_PATH)
 
 def get_leaderboard():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM leaderboard ORDER BY score DESC LIMIT 10')
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    return leaderboard.top(10)
 
 def add_score(name, score):
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO leaderboard (name, score, date) VALUES (?, ?, ?)',
-                  (name, score, current_time))
-    conn.commit()
-    conn.close()
-
-init_db()
+    leaderboard.add_score(name, score)
 
 def import_existing_leaderboard():
     if os.path.exists('../leaderboard.json'):
         try:
             with open('../leaderboard.json', 'r') as f:
                 scores = json.load(f)
-                
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT COUNT(*) FROM leaderboard')
-            count = cursor.fetchone()[0]
-            
-            if count == 0:  # Only import if leaderboard is empty
-                for score in scores:
-                    cursor.execute('INSERT INTO leaderboard (name, score, date) VALUES (?, ?, ?)',
-                                  (score['name'], score['score'], score['date']))
-                conn.commit()
-            conn.close()
+            leaderboard.import_rows(scores)  # Rows already on the board are skipped
         except Exception as e:
             print(f"Error importing leaderboard: {e}")
 
@@ -87,7 +50,13 @@ def add_score_api():
     if not name or not score:
         return jsonify({'error': 'Name and score are required'}), 400
     
-    add_score(name, score)
+    try:
+        # Returns once the group commit holding this score is durable
+        add_score(name, score)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except queue.Full:
+        return jsonify({'error': 'Too many score submissions, try again shortly'}), 503
     return jsonify({'success': True})
 
 if __name__ == '__main__':
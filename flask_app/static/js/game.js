@@ -29,6 +29,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const FIREBALL_SIZE = 15;
     const ENEMY_SIZE = 40;
     const ENEMY_SPEED = 2;
+    const VERIFY_POLL_MS = 250;
     
     let gameState = 'START'; // START, PLAYING, OVER, LEADERBOARD
     let score = 0;
@@ -48,8 +49,26 @@ document.addEventListener('DOMContentLoaded', function() {
     let fireballs = [];
     let enemies = [];
     
+    // Each run is seeded, and its inputs are recorded by frame, so the server can
+    // replay it to check the score (flask_app/replay.py follows update() exactly)
+    let seed = null;
+    let nextSeed = null;  // Issued by the server ahead of the next run
+    let random = Math.random;
+    let inputs = [];
+    
+    // The same seeded generator as the server's, so both see the same pipes and enemies
+    function mulberry32(state) {
+        return function() {
+            state = (state + 0x6D2B79F5) | 0;
+            let t = Math.imul(state ^ (state >>> 15), state | 1);
+            t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+            return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+        };
+    }
+    
     function init() {
         showScreen('START');
+        fetchSeed();
         
         document.addEventListener('keydown', handleKeyDown);
         jumpButton.addEventListener('click', handleJump);
@@ -81,6 +100,7 @@ document.addEventListener('DOMContentLoaded', function() {
             startGame();
         } else if (gameState === 'PLAYING') {
             bird.velocity = JUMP_FORCE;
+            inputs.push([frames, 'jump']);
         }
     }
     
@@ -92,6 +112,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 size: FIREBALL_SIZE,
                 color: '#FF4500'
             });
+            inputs.push([frames, 'fire']);
         }
     }
     
@@ -115,6 +136,25 @@ document.addEventListener('DOMContentLoaded', function() {
         enemies = [];
         score = 0;
         frames = 0;
+        
+        // A server seed backs one submitted replay, so the next one is fetched while this run plays.
+        // Without one the run is still played, but its score is sent without a replay
+        seed = nextSeed;
+        nextSeed = null;
+        random = mulberry32(seed !== null ? seed : crypto.getRandomValues(new Uint32Array(1))[0]);
+        inputs = [];
+        fetchSeed();
+    }
+    
+    function fetchSeed() {
+        fetch('/api/replay/seed', { method: 'POST' })
+            .then(response => response.json())
+            .then(data => {
+                nextSeed = data.seed;
+            })
+            .catch(() => {
+                nextSeed = null;
+            });
     }
     
     function gameOver() {
@@ -143,23 +183,36 @@ document.addEventListener('DOMContentLoaded', function() {
             },
             body: JSON.stringify({
                 name: playerName,
-                score: score
+                score: score,
+                replay: seed !== null ? { seed: seed, inputs: inputs } : undefined
             })
         })
         .then(response => response.json())
-        .then(data => {
-            if (data.success) {
-                loadLeaderboard();
-                showScreen('LEADERBOARD');
-            } else {
-                showMessage('Error submitting score: ' + (data.error || 'Unknown error'));
-            }
-        })
+        .then(handleScoreResult)
         .catch(error => {
             showMessage('Error submitting score: ' + error.message);
         });
     }
     
+    function handleScoreResult(data) {
+        if (data.status === 'verifying') {
+            // The server is replaying the run; ask again shortly
+            setTimeout(() => {
+                fetch(`/api/score/${data.ticket}`)
+                    .then(response => response.json())
+                    .then(handleScoreResult)
+                    .catch(error => {
+                        showMessage('Error submitting score: ' + error.message);
+                    });
+            }, VERIFY_POLL_MS);
+        } else if (data.success || data.status === 'accepted') {
+            loadLeaderboard(data.rank);
+            showScreen('LEADERBOARD');
+        } else {
+            showMessage('Error submitting score: ' + (data.error || 'Unknown error'));
+        }
+    }
+    
     function handlePlayAgain() {
         gameState = 'START';
         showScreen('START');
@@ -170,7 +223,7 @@ document.addEventListener('DOMContentLoaded', function() {
         showScreen('START');
     }
     
-    function loadLeaderboard() {
+    function loadLeaderboard(playerRank) {
         fetch('/api/leaderboard')
             .then(response => response.json())
             .then(data => {
@@ -187,6 +240,12 @@ document.addEventListener('DOMContentLoaded', function() {
                     });
                     leaderboardEntries.appendChild(list);
                 }
+                
+                if (playerRank) {
+                    const rank = document.createElement('p');
+                    rank.textContent = `You are #${playerRank.toLocaleString()}`;
+                    leaderboardEntries.appendChild(rank);
+                }
             })
             .catch(error => {
                 console.error('Error loading leaderboard:', error);
@@ -214,7 +273,7 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         
         if (frames % 100 === 0) {
-            const pipeHeight = Math.floor(Math.random() * (CANVAS_HEIGHT - PIPE_GAP - 100)) + 50;
+            const pipeHeight = Math.floor(random() * (CANVAS_HEIGHT - PIPE_GAP - 100)) + 50;
             
             pipes.push({
                 x: CANVAS_WIDTH,
@@ -238,7 +297,7 @@ document.addEventListener('DOMContentLoaded', function() {
         if (frames % 200 === 0) {
             enemies.push({
                 x: CANVAS_WIDTH,
-                y: Math.random() * (CANVAS_HEIGHT - ENEMY_SIZE),
+                y: random() * (CANVAS_HEIGHT - ENEMY_SIZE),
                 size: ENEMY_SIZE,
                 color: '#FF0000'
             });
@@ -0,0 +1,267 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const canvas = document.getElementById('game-canvas');
+    const ctx = canvas.getContext('2d');
+
+    const statusScreen = document.getElementById('status');
+    const jumpButton = document.getElementById('jump-btn');
+    const fireButton = document.getElementById('fire-btn');
+
+    const MAX_CATCH_UP_TICKS = 10;
+    const MAX_PENDING_INPUTS = 256;
+    const KEYFRAME_RETRY_MS = 1000;
+
+    // ?encoding=tiles streams only the tiles that changed; png and jpeg send whole frames
+    const encoding = new URLSearchParams(window.location.search).get('encoding') || 'png';
+
+    // Bird physics and tick rate, sent by the server with the session
+    let physics = null;
+
+    // The server renders everything but the bird; the bird is predicted here and
+    // corrected from each authoritative ack by replaying inputs the server hasn't applied yet
+    let gameState = 'START';
+    let bird = null;
+    let tick = 0;
+    let inputSeq = 0;
+    let pendingInputs = [];  // {seq, tick, action} not yet included in an ack
+    let lastAckedInput = null;
+
+    let frame = new Image();
+    // Tile diffs are patched in arrival order onto the frame they were encoded against
+    const tileCanvas = document.createElement('canvas');
+    const tileCtx = tileCanvas.getContext('2d');
+    let tileFrameId = null;
+    let tileQueue = Promise.resolve();
+    let keyframeRequestedAt = -Infinity;
+    let accumulator = 0;
+    let lastTime = null;
+
+    const socket = io({ auth: { session_token: sessionStorage.getItem('sessionToken') } });
+
+    function init() {
+        document.addEventListener('keydown', handleKeyDown);
+        jumpButton.addEventListener('click', handleJump);
+        fireButton.addEventListener('click', handleFire);
+
+        socket.on('session', handleSession);
+        socket.on('queued', data => showQueuePosition(data.position));
+        socket.on('admitted', startStreaming);
+        socket.on('game_update', handleGameUpdate);
+        socket.on('disconnect', () => showStatus('Reconnecting...'));
+
+        requestAnimationFrame(gameLoop);
+    }
+
+    function handleSession(data) {
+        if (data.session_token) {
+            // Sent again on reconnect so the server can hand back the same game
+            sessionStorage.setItem('sessionToken', data.session_token);
+            socket.auth = { session_token: data.session_token };
+        }
+
+        physics = data.physics;
+        canvas.width = physics.screen_width;
+        canvas.height = physics.screen_height;
+
+        bird = { y: physics.start_y, velocity: 0 };
+        pendingInputs = [];
+        lastAckedInput = null;
+        tileFrameId = null;
+
+        // A busy server queues new sessions and sends 'admitted' once there is room
+        if (data.queued) {
+            showQueuePosition(data.queued);
+        } else {
+            startStreaming();
+        }
+    }
+
+    function startStreaming() {
+        socket.emit('game_action', { action: 'init', encoding: encoding, predict: true });
+        showStatus(null);
+    }
+
+    function showQueuePosition(position) {
+        showStatus(`Server is busy. You are number ${position} in the queue...`);
+    }
+
+    function handleGameUpdate(state) {
+        socket.emit('frame_ack', { seq: state.seq });
+
+        if (state.frame) {
+            frame.src = `data:image/${state.format};base64,${state.frame}`;
+        } else if (state.tiles) {
+            const tiles = state.tiles;
+            tileQueue = tileQueue.then(() => applyTiles(tiles));
+        }
+        if (state.ack) {
+            reconcile(state.ack, state.game_state);
+        }
+    }
+
+    async function applyTiles(tiles) {
+        if (!tiles.keyframe && tiles.base_frame_id !== tileFrameId) {
+            // A diff went missing on the way, so this one would patch the wrong picture
+            requestKeyframe();
+            return;
+        }
+
+        let images;
+        try {
+            images = await Promise.all(tiles.tiles.map(loadTile));
+        } catch (error) {
+            tileFrameId = null;
+            requestKeyframe();
+            return;
+        }
+
+        if (tiles.keyframe) {
+            tileCanvas.width = tiles.width;
+            tileCanvas.height = tiles.height;
+        }
+        tiles.tiles.forEach((tile, index) => tileCtx.drawImage(images[index], tile.x, tile.y));
+        tileFrameId = tiles.frame_id;
+    }
+
+    function loadTile(tile) {
+        const image = new Image();
+        image.src = `data:image/png;base64,${tile.data}`;
+        return image.decode().then(() => image);
+    }
+
+    function requestKeyframe() {
+        // Asked again only if the keyframe itself was lost
+        const now = performance.now();
+        if (now - keyframeRequestedAt < KEYFRAME_RETRY_MS) return;
+        keyframeRequestedAt = now;
+        socket.emit('keyframe_request');
+    }
+
+    function handleKeyDown(event) {
+        if (event.code === 'Space') {
+            event.preventDefault();
+            handleJump();
+        } else if (event.code === 'KeyA') {
+            event.preventDefault();
+            handleFire();
+        }
+    }
+
+    function handleJump() {
+        sendInput(gameState === 'PLAYING' ? 'jump' : 'start');
+    }
+
+    function handleFire() {
+        if (gameState === 'PLAYING') {
+            sendInput('fire');
+        }
+    }
+
+    function sendInput(action) {
+        if (!physics) return;
+
+        // Applied at the start of the next tick, here and on the server
+        inputSeq++;
+        pendingInputs.push({ seq: inputSeq, tick: tick, action: action });
+        if (pendingInputs.length > MAX_PENDING_INPUTS) {
+            pendingInputs.shift();
+        }
+        socket.emit('game_action', { action: action, input_seq: inputSeq, tick: tick });
+    }
+
+    function step(state, birdState, stepTick) {
+        for (const input of pendingInputs) {
+            if (input.tick !== stepTick) continue;
+
+            if (input.action === 'start' && state !== 'PLAYING') {
+                state = 'PLAYING';
+                birdState.y = physics.start_y;
+                birdState.velocity = 0;
+            } else if (input.action === 'jump' && state === 'PLAYING') {
+                birdState.velocity = physics.jump_strength;
+            }
+        }
+
+        if (state === 'PLAYING') {
+            birdState.velocity += physics.gravity;
+            birdState.y += birdState.velocity;
+        }
+        return state;
+    }
+
+    function reconcile(ack, serverState) {
+        for (const input of pendingInputs) {
+            if (input.seq === ack.input_seq) {
+                lastAckedInput = input;
+            }
+        }
+        pendingInputs = pendingInputs.filter(input => input.seq > ack.input_seq);
+
+        let replayState = serverState;
+        const replayBird = { y: ack.bird.y, velocity: ack.bird.velocity };
+
+        // The last input the server applied lines its ticks up with ours
+        if (lastAckedInput && lastAckedInput.seq === ack.input_seq) {
+            const ackTick = lastAckedInput.tick + (ack.tick - ack.input_tick);
+            for (let t = ackTick; t < tick; t++) {
+                replayState = step(replayState, replayBird, t);
+            }
+        }
+
+        gameState = replayState;
+        bird = replayBird;
+    }
+
+    function gameLoop(now) {
+        if (physics && lastTime !== null) {
+            const tickLength = 1000 / physics.tick_rate;
+            accumulator += now - lastTime;
+
+            let steps = 0;
+            while (accumulator >= tickLength && steps < MAX_CATCH_UP_TICKS) {
+                gameState = step(gameState, bird, tick);
+                tick++;
+                accumulator -= tickLength;
+                steps++;
+            }
+            if (steps === MAX_CATCH_UP_TICKS) {
+                // The tab was in the background; the next ack will correct the bird
+                accumulator = 0;
+            }
+        }
+        lastTime = now;
+
+        render();
+        requestAnimationFrame(gameLoop);
+    }
+
+    function render() {
+        ctx.clearRect(0, 0, canvas.width, canvas.height);
+
+        if (encoding === 'tiles') {
+            if (tileFrameId !== null) {
+                ctx.drawImage(tileCanvas, 0, 0, canvas.width, canvas.height);
+            }
+        } else if (frame.complete && frame.naturalWidth) {
+            ctx.drawImage(frame, 0, 0, canvas.width, canvas.height);
+        }
+
+        // The server draws the bird itself during the death cutscene
+        if (physics && gameState !== 'OVER') {
+            ctx.fillStyle = '#FFFF00';
+            ctx.fillRect(physics.x, bird.y, physics.width, physics.height);
+            ctx.strokeStyle = 'black';
+            ctx.strokeRect(physics.x, bird.y, physics.width, physics.height);
+        }
+    }
+
+    function showStatus(message) {
+        if (message) {
+            statusScreen.querySelector('p').textContent = message;
+            statusScreen.classList.remove('hidden');
+        } else {
+            statusScreen.classList.add('hidden');
+        }
+    }
+
+    init();
+});
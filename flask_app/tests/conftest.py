@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The server modules import each other by name, as they do when run from flask_app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
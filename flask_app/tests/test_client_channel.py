@@ -0,0 +1,125 @@
+import base64
+import io
+
+import pygame
+import pytest
+
+from client_channel import ClientChannel
+from frame_codec import TileDiffEncoder
+
+WIDTH = 120
+HEIGHT = 80
+TILE = 40
+
+
+class TileClient:
+    """Applies tile payloads the way static/js/stream.js does"""
+
+    def __init__(self):
+        self.surface = pygame.Surface((WIDTH, HEIGHT))
+        self.frame_id = None
+
+    def apply(self, payload):
+        if not payload['keyframe'] and payload['base_frame_id'] != self.frame_id:
+            return False
+        for tile in payload['tiles']:
+            image = pygame.image.load(io.BytesIO(base64.b64decode(tile['data'])), 'tile.png')
+            self.surface.blit(image, (tile['x'], tile['y']))
+        self.frame_id = payload['frame_id']
+        return True
+
+
+def frame(*colored_tiles):
+    """A black frame with the given (tile x, tile y, color) tiles filled in"""
+    surface = pygame.Surface((WIDTH, HEIGHT))
+    surface.fill((0, 0, 0))
+    for x, y, color in colored_tiles:
+        surface.fill(color, pygame.Rect(x * TILE, y * TILE, TILE, TILE))
+    return surface
+
+
+def same_pixels(a, b):
+    return pygame.image.tostring(a, 'RGB') == pygame.image.tostring(b, 'RGB')
+
+
+@pytest.fixture
+def encoder():
+    return TileDiffEncoder(WIDTH, HEIGHT, tile_size=TILE)
+
+
+def test_tile_that_reverts_is_sent_again(encoder):
+    client = TileClient()
+    for surface in [frame(), frame((0, 1, (0, 0, 255))), frame()]:
+        assert client.apply(encoder.encode(surface))
+        assert same_pixels(client.surface, surface)
+
+
+def test_waiting_tile_frames_are_merged_not_dropped(encoder):
+    channel = ClientChannel('sid', 30, max_in_flight=1)
+    client = TileClient()
+
+    first = channel.offer({'tiles': encoder.encode(frame())})
+    assert client.apply(first['tiles'])
+
+    # The client is busy, so these queue up behind the first frame
+    frames = [frame((0, 0, (255, 0, 0))), frame((0, 0, (255, 0, 0)), (2, 1, (0, 255, 0))), frame((2, 1, (0, 255, 0)))]
+    for surface in frames:
+        assert channel.offer({'tiles': encoder.encode(surface)}) is None
+
+    payload = channel.acknowledge(first['seq'])
+    assert client.apply(payload['tiles'])
+    assert same_pixels(client.surface, frames[-1])
+    assert not channel.keyframe_needed()
+
+
+def test_waiting_keyframe_survives_later_diffs(encoder):
+    channel = ClientChannel('sid', 30, max_in_flight=1)
+    client = TileClient()
+    first = channel.offer({'tiles': encoder.encode(frame())})
+
+    encoder.request_keyframe()
+    latest = frame((1, 1, (0, 0, 255)))
+    for surface in [frame((1, 0, (255, 255, 0))), latest]:
+        channel.offer({'tiles': encoder.encode(surface)})
+
+    payload = channel.acknowledge(first['seq'])
+    assert payload['tiles']['keyframe']
+    assert client.apply(payload['tiles'])
+    assert same_pixels(client.surface, latest)
+
+
+def test_unmergeable_diff_asks_for_keyframe(encoder):
+    channel = ClientChannel('sid', 30, max_in_flight=1)
+    channel.offer({'tiles': encoder.encode(frame())})
+    channel.offer({'tiles': encoder.encode(frame((0, 0, (255, 0, 0))))})
+    encoder.encode(frame())  # Never offered to the channel
+    channel.offer({'tiles': encoder.encode(frame((1, 0, (255, 0, 0))))})
+
+    assert channel.keyframe_needed()
+    assert not channel.keyframe_needed()
+
+
+def test_ladder_follows_the_broadcast_rate():
+    channel = ClientChannel('sid', 20)
+    rates = []
+    for level in range(5):
+        channel.level = level
+        rates.append(channel.quality()[0])
+    assert rates == [20, 10, 10, 7, 3]
+
+
+def test_keyframe_requests_are_rate_limited():
+    channel = ClientChannel('sid', 30)
+    channel.request_keyframe()
+    channel.request_keyframe()
+    assert channel.keyframe_needed()
+    channel.request_keyframe()
+    assert not channel.keyframe_needed()
+
+
+def test_unknown_encoding_falls_back_to_png():
+    channel = ClientChannel('sid', 30)
+    channel.set_encoding({'codec': 'gif'})
+    assert channel.encoding == 'png'
+    channel.set_encoding('tiles')
+    assert channel.quality() == (30, 'tiles')
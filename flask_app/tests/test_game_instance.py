@@ -0,0 +1,22 @@
+from game_server import GameInstance, FPS, BROADCAST_FPS
+
+
+def test_shared_leaderboard_store_is_not_charged_to_each_game(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # The instance opens leaderboard.db in the working directory
+    game = GameInstance('player')
+    before = game.memory_report()['leaderboard']
+
+    game.leaderboard.store.score_counts.add_many({score: 1 for score in range(100000)})
+    assert game.memory_report()['leaderboard'] == before
+
+
+def test_frame_rate_from_a_quality_action_is_validated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    game = GameInstance('player')
+    for frame_rate in ('fast', None, True, float('nan'), 0, -5):
+        game.handle_action('quality', {'frame_rate': frame_rate, 'encoding': 'gif'})
+        assert game.frame_interval == round(FPS / BROADCAST_FPS)
+        assert game.encoding == 'png'
+
+    game.handle_action('quality', {'frame_rate': 10 ** 6})
+    assert game.frame_interval == round(FPS / BROADCAST_FPS)
@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from leaderboard_store import LeaderboardStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LeaderboardStore(str(tmp_path / 'leaderboard.db'))
+
+
+def test_submit_rejects_names_that_are_not_text(store):
+    for name in (['x'], '', 'x' * 1000, None):
+        with pytest.raises(ValueError):
+            store.submit_score(name, 10)
+
+
+def test_bad_row_fails_only_its_own_submission(store):
+    store.writer.window = 0.2  # Long enough for all three to share a batch
+    good = store.writer.submit({'name': 'ada', 'score': 5, 'date': '2026-01-01 12:00:00'})
+    bad = store.writer.submit({'name': ['x'], 'score': 6, 'date': '2026-01-01 12:00:00'})
+    other = store.writer.submit({'name': 'bob', 'score': 7, 'date': '2026-01-01 12:00:00'})
+
+    assert good.result(timeout=5) != other.result(timeout=5)
+    assert bad.exception(timeout=5) is not None
+    assert [row['name'] for row in store.top(10)] == ['bob', 'ada']
+
+
+def test_committed_scores_succeed_when_caching_fails(store, monkeypatch):
+    def broken(rows):
+        raise RuntimeError('cache')
+    monkeypatch.setattr(store, 'remember', broken)
+
+    row_id = store.add_score('ada', 5)
+    with store.connection() as conn:
+        assert conn.execute('SELECT name FROM leaderboard WHERE id = ?', (row_id,)).fetchone()[0] == 'ada'
+
+
+def board_rows(store):
+    """Every row in board order, with the rank ORDER BY score DESC, id gives it"""
+    with store.connection() as conn:
+        rows = [dict(row) for row in conn.execute('SELECT id, name, score, date FROM leaderboard '
+                                                  'ORDER BY score DESC, id')]
+    for row in rows:
+        row['rank'] = 1 + sum(1 for other in rows if other['score'] > row['score'])
+    return rows
+
+
+def fill(store, count, seed):
+    """Random scores, mostly clustered so there are many ties, a few past the tree's first 1024"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        score = rng.choice([rng.randint(0, 20), rng.randint(0, 1000), rng.randint(1024, 5000)])
+        records.append({'name': f'p{i % 17}', 'score': score, 'date': f'2026-01-{1 + i % 28:02d} 12:00:{i % 60:02d}'})
+    # Several imports, so the counts grow through both the incremental and the rebuilding paths
+    for start in range(0, count, 97):
+        store.import_rows(records[start:start + 97])
+    store.add_score('solo', 5001)  # One row past everything imported
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_rank_page_and_around_match_sql(tmp_path, seed):
+    store = LeaderboardStore(str(tmp_path / 'leaderboard.db'))
+    fill(store, 600, seed)
+    expected = board_rows(store)
+    total = len(expected)
+    assert store.count() == total
+    assert store.score_counts.size > 1024
+
+    scores = {row['score'] for row in expected} | {0, 1023, 1024, 5001, 5002, 10 ** 6}
+    for score in scores:
+        assert store.rank(score) == 1 + sum(1 for row in expected if row['score'] > score)
+
+    for per_page in (1, 7, 25, 100):
+        for offset in list(range(0, total, per_page)) + [total - 1, total, total + 5]:
+            assert store.page(offset, per_page) == expected[offset:offset + per_page]
+
+    for rank in [1, 2, total // 2, total - 1, total, total + 1, total + 10]:
+        for radius in (0, 3, 25):
+            start = max(0, rank - 1 - radius)
+            assert store.around(rank, radius) == expected[start:rank + radius]
+
+
+def test_counts_rebuilt_at_startup_match_sql(tmp_path):
+    path = str(tmp_path / 'leaderboard.db')
+    fill(LeaderboardStore(path), 300, 4)
+    store = LeaderboardStore(path)
+    expected = board_rows(store)
+    for offset in range(len(expected) + 2):
+        assert store.page(offset, 3) == expected[offset:offset + 3]
@@ -0,0 +1,67 @@
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from leaderboard_store import LeaderboardStore
+from replay import ReplayVerifier, simulate
+
+
+@pytest.fixture
+def verifier(tmp_path):
+    verifier = ReplayVerifier(LeaderboardStore(str(tmp_path / 'leaderboard.db')), workers=1)
+    yield verifier
+    verifier.close()
+
+
+def wait_for(verifier, ticket):
+    deadline = time.monotonic() + 30
+    while verifier.status(ticket)['status'] == 'verifying':
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    return verifier.status(ticket)
+
+
+def test_seed_must_be_issued(verifier):
+    with pytest.raises(ValueError):
+        verifier.submit('ada', 0, {'seed': 12345, 'inputs': []})
+
+
+def test_replay_is_accepted_once(verifier):
+    seed = verifier.issue_seed()
+    score, _ = simulate(seed, [])
+    replay = {'seed': seed, 'inputs': []}
+
+    assert wait_for(verifier, verifier.submit('ada', score, replay))['status'] == 'accepted'
+    with pytest.raises(ValueError):
+        verifier.submit('ada', score, replay)
+
+
+class BrokenPool:
+    def submit(self, *args):
+        raise BrokenProcessPool('A worker died')
+
+    def shutdown(self, **kwargs):
+        pass
+
+
+def test_broken_pool_is_replaced(verifier):
+    verifier.executor = BrokenPool()
+    seed = verifier.issue_seed()
+    score, _ = simulate(seed, [])
+
+    ticket = verifier.submit('ada', score, {'seed': seed, 'inputs': []})
+    assert wait_for(verifier, ticket)['status'] == 'accepted'
+    assert not isinstance(verifier.executor, BrokenPool)
+
+
+def test_failed_submission_is_rolled_back(verifier):
+    verifier.start()
+    verifier.executor.shutdown()
+    seed = verifier.issue_seed()
+
+    with pytest.raises(RuntimeError):
+        verifier.submit('ada', 0, {'seed': seed, 'inputs': []})
+    assert verifier.stats()['queued'] == 0
+    assert not verifier.tickets
+    assert seed in verifier.seeds
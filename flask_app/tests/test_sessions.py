@@ -0,0 +1,20 @@
+from sessions import SessionManager
+
+
+def test_token_takes_over_a_session_still_attached_to_a_dead_socket():
+    sessions = SessionManager(on_expire=lambda game_id: None)
+    player, resumed, stale_sid = sessions.connect('old')
+    assert not resumed and stale_sid is None
+
+    again, resumed, stale_sid = sessions.connect('new', player.token)
+    assert again is player and resumed and stale_sid == 'old'
+    assert sessions.for_sid('old') is None
+    # The old socket's disconnect, when it finally comes, no longer touches the session
+    assert sessions.disconnect('old') is None
+    assert player.sid == 'new' and player.disconnected_at is None
+
+
+def test_unknown_token_starts_a_new_session():
+    sessions = SessionManager(on_expire=lambda game_id: None)
+    player, resumed, stale_sid = sessions.connect('sid', 'not-a-token')
+    assert not resumed and stale_sid is None and player.token != 'not-a-token'
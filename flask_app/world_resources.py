@@ -0,0 +1,197 @@
+import random
+from threading import Lock, local
+
+import pygame
+
+from flappy_bird import (
+    SCREEN_WIDTH, SCREEN_HEIGHT, BACKGROUND_SPEED, RAIN_DENSITY, LIGHTNING_CHANCE,
+    WEATHER_CHANGE_INTERVAL, BUILDING_COLORS, WINDOW_COLOR, LIGHT_COLOR, EMPIRE_STATE_COLOR,
+    SHADOW_COLOR, SKY_COLOR, CLOUD_COLOR, CLOUD_SHADOW, RAIN_COLOR, LIGHTNING_COLOR
+)
+
+CITY_STRIP_WIDTH = SCREEN_WIDTH * 3  # Wraps seamlessly so instances only keep an offset
+CLOUD_STRIP_WIDTH = SCREEN_WIDTH * 2
+RAIN_STRIP_HEIGHT = SCREEN_HEIGHT * 2
+CLOUD_SPEED = 0.35  # Average of the per-cloud speeds in Cityscape
+RAIN_SPEED = 7.5  # Average of the per-drop speeds in WeatherSystem
+LIGHTNING_DURATION = 5  # frames
+
+
+class SharedWorld:
+    """Read-only cosmetic resources built once per process and shared by every GameInstance"""
+
+    def __init__(self):
+        self.sky = self._build_sky()
+        self.city = self._build_city()
+        self.clouds = self._build_clouds()
+        self.rain = self._build_rain()
+        self.flash = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+        self.flash.fill((*LIGHTNING_COLOR, 128))
+        # Render targets and fonts are per thread, since pygame surfaces are not safe to share while drawing
+        self.thread_state = local()
+
+    def canvas(self):
+        """Scratch surface frames are drawn onto before encoding"""
+        if not hasattr(self.thread_state, 'canvas'):
+            self.thread_state.canvas = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        return self.thread_state.canvas
+
+    def font(self, size):
+        """Default font at the given size"""
+        if not hasattr(self.thread_state, 'fonts'):
+            self.thread_state.fonts = {}
+        fonts = self.thread_state.fonts
+        if size not in fonts:
+            fonts[size] = pygame.font.Font(None, size)
+        return fonts[size]
+
+    def surfaces(self):
+        """Shared surfaces, for memory accounting"""
+        return [self.sky, self.city, self.clouds, self.rain, self.flash]
+
+    def _build_sky(self):
+        sky = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        sky.fill(SKY_COLOR)
+        for y in range(SCREEN_HEIGHT):
+            shade = 1 - 0.25 * y / SCREEN_HEIGHT
+            color = tuple(int(c * shade) for c in SKY_COLOR)
+            pygame.draw.line(sky, color, (0, y), (SCREEN_WIDTH, y))
+        return sky
+
+    def _build_city(self):
+        strip = pygame.Surface((CITY_STRIP_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+        x = 0
+        while x < CITY_STRIP_WIDTH:
+            if random.random() < 0.05:
+                width, height = 120, 400
+                self._draw_building(strip, x, width, height, EMPIRE_STATE_COLOR, 0.5, True)
+            else:
+                width = random.randint(30, 80)
+                height = random.randint(100, 300)
+                self._draw_building(strip, x, width, height, random.choice(BUILDING_COLORS), 0.3, False)
+            x += width + random.randint(10, 30)
+        return strip
+
+    def _draw_building(self, strip, x, width, height, color, lit_chance, is_empire_state):
+        # Draw at both ends of the strip so it tiles without a seam
+        for offset in (0, -CITY_STRIP_WIDTH):
+            left = x + offset
+            top = SCREEN_HEIGHT - height
+            pygame.draw.rect(strip, (*SHADOW_COLOR[:3], 64), (left + 2, top + 2, width, height))
+            pygame.draw.rect(strip, color, (left, top, width, height))
+
+            window_size = 4
+            window_spacing = 8
+            columns = (width - window_spacing) // (window_size + window_spacing)
+            rows = (height - window_spacing) // (window_size + window_spacing)
+            for i in range(columns):
+                for j in range(rows):
+                    window_color = LIGHT_COLOR if random.random() < lit_chance else WINDOW_COLOR
+                    pygame.draw.rect(strip, window_color,
+                                     (left + window_spacing + i * (window_size + window_spacing),
+                                      top + window_spacing + j * (window_size + window_spacing),
+                                      window_size, window_size))
+
+            if is_empire_state:
+                spire_width, spire_height = 10, 50
+                pygame.draw.rect(strip, color,
+                                 (left + (width - spire_width) // 2, top - spire_height,
+                                  spire_width, spire_height))
+
+    def _build_clouds(self):
+        strip = pygame.Surface((CLOUD_STRIP_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+        for _ in range(10):
+            x = random.randint(0, CLOUD_STRIP_WIDTH)
+            y = random.randint(50, 200)
+            width = random.randint(60, 120)
+            height = random.randint(20, 40)
+            density = random.uniform(0.5, 1.0)
+            for offset in (0, -CLOUD_STRIP_WIDTH):
+                pygame.draw.ellipse(strip, (*CLOUD_SHADOW, int(64 * density)),
+                                    (x + offset + 2, y + 2, width, height))
+                pygame.draw.ellipse(strip, (*CLOUD_COLOR, int(255 * density)),
+                                    (x + offset, y, width, height))
+        return strip
+
+    def _build_rain(self):
+        strip = pygame.Surface((SCREEN_WIDTH, RAIN_STRIP_HEIGHT), pygame.SRCALPHA)
+        streaks = int(SCREEN_WIDTH * SCREEN_HEIGHT * RAIN_DENSITY) * RAIN_STRIP_HEIGHT // SCREEN_HEIGHT
+        for _ in range(streaks):
+            x = random.randint(0, SCREEN_WIDTH)
+            y = random.randint(0, RAIN_STRIP_HEIGHT)
+            length = random.randint(5, 15)
+            color = (*RAIN_COLOR[:3], random.randint(64, 128))
+            for offset in (0, -RAIN_STRIP_HEIGHT):
+                pygame.draw.line(strip, color, (x, y + offset), (x, y + offset + length), 1)
+        return strip
+
+
+class WorldView:
+    """Per-instance scroll offsets and weather state over the shared world"""
+
+    def __init__(self, world):
+        self.world = world
+        self.reset()
+
+    def reset(self):
+        """Start from a random point in the strips so instances don't all look alike"""
+        self.city_offset = random.uniform(0, CITY_STRIP_WIDTH)
+        self.cloud_offset = random.uniform(0, CLOUD_STRIP_WIDTH)
+        self.rain_offset = 0.0
+        self.weather_type = 'clear'  # 'clear', 'rainy', 'stormy'
+        self.weather_timer = 0
+        self.lightning_timer = 0
+
+    def update(self, weather=True):
+        self.city_offset = (self.city_offset + BACKGROUND_SPEED) % CITY_STRIP_WIDTH
+        self.cloud_offset = (self.cloud_offset + CLOUD_SPEED) % CLOUD_STRIP_WIDTH
+        if not weather:
+            # Shed under load: no rain blit and no lightning flash
+            self.weather_type = 'clear'
+            self.lightning_timer = 0
+            return
+        if self.weather_type != 'clear':
+            self.rain_offset = (self.rain_offset + RAIN_SPEED) % RAIN_STRIP_HEIGHT
+
+        if self.lightning_timer > 0:
+            self.lightning_timer -= 1
+        elif self.weather_type == 'stormy' and random.random() < LIGHTNING_CHANCE:
+            self.lightning_timer = LIGHTNING_DURATION
+
+        self.weather_timer += 1
+        if self.weather_timer >= WEATHER_CHANGE_INTERVAL:
+            self.weather_timer = 0
+            self.weather_type = random.choice(['clear', 'rainy', 'stormy'])
+
+    def draw(self, surface):
+        world = self.world
+        surface.blit(world.sky, (0, 0))
+
+        cloud_x = int(self.cloud_offset)
+        surface.blit(world.clouds, (-cloud_x, 0))
+        surface.blit(world.clouds, (CLOUD_STRIP_WIDTH - cloud_x, 0))
+
+        city_x = int(self.city_offset)
+        surface.blit(world.city, (-city_x, 0))
+        surface.blit(world.city, (CITY_STRIP_WIDTH - city_x, 0))
+
+        if self.weather_type != 'clear':
+            rain_y = int(self.rain_offset)
+            surface.blit(world.rain, (0, rain_y))
+            surface.blit(world.rain, (0, rain_y - RAIN_STRIP_HEIGHT))
+
+        if self.lightning_timer > 0:
+            surface.blit(world.flash, (0, 0))
+
+
+_shared_world = None
+_shared_world_lock = Lock()
+
+
+def shared_world():
+    """The process-wide SharedWorld, built on first use"""
+    global _shared_world
+    with _shared_world_lock:
+        if _shared_world is None:
+            _shared_world = SharedWorld()
+        return _shared_world
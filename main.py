@@ -53,6 +53,7 @@ cityscape = None
 donkey_kong = None
 weather_system = None
 leaderboard = None
+leaderboard_loader = None
 winning_cutscene = None
 death_cutscene = None
 luigi_battle = None
@@ -76,6 +77,7 @@ async def initialize_game():
     """Initialize game objects and load resources"""
     global jump_sound, score_sound, collision_sound, game_over_sound, power_pipe_sound, lightning_sound, rain_sound
     global bird, pipes, cityscape, donkey_kong, weather_system, leaderboard, winning_cutscene, death_cutscene, luigi_battle
+    global leaderboard_loader
     global game_state, countdown_start, last_pipe_time, score, current_pipe_speed, speed_level, player_name, power_ups, enemies, fireballs
     
     try:
@@ -96,6 +98,9 @@ async def initialize_game():
     donkey_kong = DonkeyKong()
     weather_system = WeatherSystem()
     leaderboard = Leaderboard()
+    if leaderboard.is_browser:
+        # localStorage is read while the first frames draw; the task is kept so it isn't collected
+        leaderboard_loader = asyncio.create_task(leaderboard.load_scores_async())
     winning_cutscene = WinningCutscene()
     death_cutscene = DeathCutscene(screen)
     luigi_battle = LuigiBattle()
@@ -177,7 +182,7 @@ async def main():
         screen.fill(WHITE)
         
         if game_state == GAME_STATE_PLAYING:
-            bird.update()
+            bird.update(playing=True)
             cityscape.update()
             
             cityscape.draw()
@@ -413,6 +418,8 @@ async def main():
         weather_system.update()
         weather_system.draw()
         
+        leaderboard.persist(game_state != GAME_STATE_PLAYING)
+        
         pygame.display.flip()
         clock.tick(FPS)
         
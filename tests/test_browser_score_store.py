@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+from flappy_bird import (
+    BrowserScoreStore, BROWSER_LEADERBOARD_KEY, BROWSER_INDEX_KEY, BROWSER_ENTRY_PREFIX
+)
+
+
+class FakeStorage(dict):
+    """The slice of window.localStorage the store uses"""
+
+    def getItem(self, key):
+        return self.get(key)
+
+    def setItem(self, key, value):
+        self[key] = value
+
+    def removeItem(self, key):
+        self.pop(key, None)
+
+
+def entry(name, score):
+    return {'name': name, 'score': score, 'date': '2026-01-01 12:00:00'}
+
+
+def load(storage):
+    store = BrowserScoreStore(storage)
+    return store, asyncio.run(store.load())
+
+
+def flush(store):
+    # Well past the debounce, with no game running
+    while store.pending():
+        store.persist(True, now=10 ** 9)
+
+
+def test_new_score_survives_a_reload():
+    storage = FakeStorage()
+    store, board = load(storage)
+    assert board == []
+
+    store.save([entry('ada', 5)])
+    flush(store)
+    assert load(storage)[1] == [entry('ada', 5)]
+
+    store.save([entry('bob', 9), entry('ada', 5)])
+    flush(store)
+    assert load(storage)[1] == [entry('bob', 9), entry('ada', 5)]
+
+
+def test_legacy_board_survives_migration_and_reload():
+    legacy = [entry('ada', 5), entry('bob', 3)]
+    storage = FakeStorage({BROWSER_LEADERBOARD_KEY: json.dumps(legacy)})
+    store, board = load(storage)
+    assert board == legacy
+
+    flush(store)
+    assert BROWSER_LEADERBOARD_KEY not in storage
+    assert load(storage)[1] == legacy
+
+
+def test_corrupt_entry_is_dropped_from_the_index():
+    storage = FakeStorage({
+        BROWSER_INDEX_KEY: json.dumps([0, 1]),
+        BROWSER_ENTRY_PREFIX + '0': json.dumps(entry('ada', 5)),
+        BROWSER_ENTRY_PREFIX + '1': '{corrupt'
+    })
+    store, board = load(storage)
+    assert board == [entry('ada', 5)]
+
+    flush(store)
+    assert BROWSER_ENTRY_PREFIX + '1' not in storage
+    assert load(storage)[1] == [entry('ada', 5)]